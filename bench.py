@@ -0,0 +1,318 @@
+"""
+オフラインベンチマーク
+ローカルの aiohttp サーバーから生成（または記録済み）フィードを配信し、
+送信内容を記録するだけの偽チャンネルに向けて bot.py の処理を端から端まで実行する。
+
+    python bench.py                         # 9 / 100 / 1000 フィード × 20 件
+    python bench.py --feeds 9,5000 --items 20,200 --latency 50
+    python bench.py --fixtures recorded/    # 記録済みの RSS/Atom ファイルを配信する
+
+実際のサイトや Discord には一切接続しない。
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from aiohttp import web
+
+# bot.py が読み込む .env の設定より先に、計測向けの値を入れておく
+os.environ.setdefault("METRICS_PORT", "0")
+os.environ.setdefault("SEND_BURST", "1000000")
+os.environ.setdefault("SEND_PER_SECOND", "1000000")
+os.environ.setdefault("FETCH_RETRIES", "0")
+
+import bot  # noqa: E402
+
+# ランキングの集計期間に入るよう、記事の日付は実行時刻の少し前から始める
+BASE_TIME = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(days=2)
+
+
+# ── フィクスチャ生成 ──────────────────────────────────────
+def _rss2(feed_no: int, items: range) -> str:
+    body = "".join(
+        f"<item><title>Feed {feed_no} 記事 {i} Python AI セキュリティ</title>"
+        f"<link>https://example.com/{feed_no}/{i}</link><guid>{feed_no}-{i}</guid>"
+        f"<description>&lt;p&gt;記事 {i} の概要です。{'本文' * 40}&lt;/p&gt;</description>"
+        f"<pubDate>{format_datetime(BASE_TIME + timedelta(minutes=10 * i))}</pubDate>"
+        f"<category>AI</category><dc:creator>author{i % 7}</dc:creator></item>"
+        for i in reversed(items)
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<rss version="2.0" xmlns:dc="http://purl.org/dc/elements/1.1/">'
+        f"<channel><title>Feed {feed_no}</title>{body}</channel></rss>"
+    )
+
+
+def _atom(feed_no: int, items: range) -> str:
+    body = "".join(
+        f"<entry><title>Feed {feed_no} entry {i} TypeScript Rust</title>"
+        f'<link rel="alternate" href="https://example.com/{feed_no}/{i}"/>'
+        f"<id>tag:example.com,2024:{feed_no}-{i}</id>"
+        f"<published>{(BASE_TIME + timedelta(minutes=10 * i)).isoformat()}</published>"
+        f"<summary>entry {i} summary {'text ' * 40}</summary>"
+        f"<author><name>author{i % 5}</name></author></entry>"
+        for i in reversed(items)
+    )
+    return f'<?xml version="1.0" encoding="utf-8"?><feed xmlns="http://www.w3.org/2005/Atom"><title>Feed {feed_no}</title>{body}</feed>'
+
+
+def _rdf(feed_no: int, items: range) -> str:
+    """はてなブックマーク形式 (RSS 1.0 + hatena:bookmarkcount)"""
+    body = "".join(
+        f'<item rdf:about="https://example.com/{feed_no}/{i}"><title>Hatena {feed_no} 記事 {i} Claude</title>'
+        f"<link>https://example.com/{feed_no}/{i}</link><description>はてな {i}</description>"
+        f"<dc:date>{(BASE_TIME + timedelta(minutes=10 * i)).isoformat()}</dc:date>"
+        f"<hatena:bookmarkcount>{(i * 37) % 500 + 1}</hatena:bookmarkcount></item>"
+        for i in reversed(items)
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<rdf:RDF xmlns="http://purl.org/rss/1.0/" xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"'
+        ' xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:hatena="http://www.hatena.ne.jp/info/xmlns#">'
+        f"<channel><title>Hatena {feed_no}</title></channel>{body}</rdf:RDF>"
+    )
+
+
+GENERATORS = (_rss2, _atom, _rdf)
+
+
+class FeedServer:
+    """別スレッドのイベントループで動くローカルのフィード配信サーバー。
+
+    generation を進めると各フィードの先頭に新着記事が new_per_bump 件ずつ増える。
+    ETag / If-None-Match に対応し、latency 秒だけ応答を遅らせる。
+    """
+
+    def __init__(self, items: int, latency: float, hosts: int, fixtures: list[bytes] | None):
+        self.items = items
+        self.latency = latency
+        self.hosts = [f"127.0.0.{i + 1}" for i in range(hosts)]
+        self.fixtures = fixtures
+        self.generation = 0
+        self.new_per_bump = 2
+        self.requests = 0
+        self.bytes_sent = 0
+        self._cache: dict[tuple[int, int], bytes] = {}
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self.port = 0
+
+    def url(self, feed_no: int) -> str:
+        return f"http://{self.hosts[feed_no % len(self.hosts)]}:{self.port}/feed/{feed_no}.xml"
+
+    def _body(self, feed_no: int) -> bytes:
+        key = (feed_no, self.generation)
+        if key not in self._cache:
+            if self.fixtures:
+                self._cache[key] = self.fixtures[feed_no % len(self.fixtures)]
+            else:
+                start = self.generation * self.new_per_bump
+                generate = GENERATORS[feed_no % len(GENERATORS)]
+                self._cache[key] = generate(feed_no, range(start, start + self.items)).encode()
+        return self._cache[key]
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        feed_no = int(request.match_info["no"])
+        etag = f'"{feed_no}-{self.generation}"'
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        body = self._body(feed_no)
+        self.bytes_sent += len(body)
+        return web.Response(body=body, content_type="application/xml", headers={"ETag": etag})
+
+    async def _start(self) -> None:
+        app = web.Application()
+        app.router.add_get("/feed/{no}.xml", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.hosts[0], 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        for host in self.hosts[1:]:
+            await web.TCPSite(self._runner, host, self.port).start()
+
+    def start(self) -> None:
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+
+    def stop(self) -> None:
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+class FakeChannel:
+    """send の呼び出しを記録するだけのチャンネル"""
+
+    def __init__(self, channel_id: int = 1):
+        self.id = channel_id
+        self.messages = 0
+        self.embeds = 0
+
+    async def send(self, content=None, *, embed=None, embeds=None, **kwargs):
+        self.messages += 1
+        self.embeds += (1 if embed is not None else 0) + len(embeds or ())
+        return None
+
+
+# ── 計測 ──────────────────────────────────────────────────
+def _parse_seconds() -> float:
+    # パースの待ち時間（ワーカープール・同時実行枠）は含めず、パース処理自体の CPU 時間だけを数える
+    return sum(bot.PARSE_CPU.values.values())
+
+
+async def _measure(label: str, coro_factory, channels: list[FakeChannel], server: FeedServer, trace_memory: bool) -> dict:
+    messages = sum(channel.messages for channel in channels)
+    embeds = sum(channel.embeds for channel in channels)
+    requests, sent_bytes = server.requests, server.bytes_sent
+    parse_before = _parse_seconds()
+    entries_before = sum(bot.FEED_ENTRIES.values.values())
+    if trace_memory:
+        tracemalloc.start()
+    cpu = time.process_time()
+    start = time.perf_counter()
+    await coro_factory()
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu
+    peak = None
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    entries = sum(bot.FEED_ENTRIES.values.values()) - entries_before
+    return {
+        "scenario": label,
+        "seconds": elapsed,
+        "cpu": cpu,
+        "parse_cpu": _parse_seconds() - parse_before,
+        "requests": server.requests - requests,
+        "kib": (server.bytes_sent - sent_bytes) / 1024,
+        "entries": entries,
+        "entries_per_s": entries / elapsed if elapsed else 0.0,
+        "messages": sum(channel.messages for channel in channels) - messages,
+        "embeds": sum(channel.embeds for channel in channels) - embeds,
+        "peak_mib": None if peak is None else peak / 1024 / 1024,
+    }
+
+
+async def run_case(n_feeds: int, n_items: int, args) -> list[dict]:
+    fixtures = None
+    if args.fixtures:
+        fixtures = [p.read_bytes() for p in sorted(Path(args.fixtures).iterdir()) if p.is_file()]
+    server = FeedServer(n_items, args.latency / 1000, args.hosts, fixtures)
+    server.start()
+
+    # 状態はすべて一時ディレクトリに置き、実運用のファイルには触れない
+    workdir = Path(tempfile.mkdtemp(prefix="newsbot-bench-"))
+    bot.seen_store = bot.SeenStore(workdir / "seen.db")
+    bot.feed_cache = bot.FeedCache(workdir / "http_cache")
+    bot.archive = bot.ArticleArchive(workdir / "articles.db", bot.ARCHIVE_RETENTION_DAYS)
+    bot.bookmark_ranking = bot.BookmarkRanking(workdir / "bookmarks.db")
+    bot.STAGE_SECONDS.values.clear()
+    bot.FEED_ENTRIES.values.clear()
+
+    feeds = [
+        {"name": f"bench-{i}", "url": server.url(i), "color": 0x5865F2, "icon": ""}
+        for i in range(n_feeds)
+    ]
+    bot.RSS_FEEDS = feeds
+    bot.MORNING_FEEDS = feeds[:3]
+    bot.RANKING_FEED = feeds[2]["name"]   # RSS 1.0 (はてな形式) のフィクスチャ
+    channel = FakeChannel()
+    # 別々の既読を持つ購読先へ同じフィードを配る（取得・パース・Embed 作成は1回のまま）
+    subscribers = [FakeChannel(100 + i) for i in range(args.channels)]
+    routes = [(sub, bot.Route(sub.id, namespace=str(sub.id))) for sub in subscribers]
+
+    def measure(label, coro_factory, channels=(channel,)):
+        return _measure(label, coro_factory, list(channels), server, args.memory)
+
+    results = []
+    try:
+        results.append(await measure("cold", lambda: bot._check_feeds(channel, feeds)))
+        server.generation += 1
+        results.append(await measure("updated", lambda: bot._check_feeds(channel, feeds)))
+        results.append(await measure("unchanged", lambda: bot._check_feeds(channel, feeds)))
+        server.generation += 1
+        results.append(await measure("fanout", lambda: bot._deliver_feeds(routes, feeds), subscribers))
+        server.generation += 1
+        results.append(await measure("morning", lambda: bot._post_morning_news([channel])))
+        results.append(await measure("weekly", lambda: bot._post_weekly_ranking([channel])))
+    finally:
+        await bot.dispatcher.close()
+        await bot.close_http_session()
+        bot.shutdown_parse_executor()
+        server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+    for result in results:
+        result.update(feeds=n_feeds, items=n_items)
+    return results
+
+
+async def run_all(args) -> list[dict]:
+    # bot.py のモジュール状態（セマフォなど）は1つのイベントループに紐づくため、全ケースを同じループで回す
+    rows = []
+    for n_feeds in (int(v) for v in args.feeds.split(",")):
+        for n_items in (int(v) for v in args.items.split(",")):
+            rows.extend(await run_case(n_feeds, n_items, args))
+    return rows
+
+
+COLUMNS = (
+    ("feeds", "feeds", "{:>6}"),
+    ("items", "items", "{:>5}"),
+    ("scenario", "scenario", "{:<9}"),
+    ("seconds", "tick s", "{:>8.3f}"),
+    ("cpu", "cpu s", "{:>7.3f}"),
+    ("parse_cpu", "parse cpu", "{:>9.3f}"),
+    ("requests", "reqs", "{:>6}"),
+    ("kib", "KiB", "{:>9.0f}"),
+    ("entries", "entries", "{:>8}"),
+    ("entries_per_s", "entries/s", "{:>10.0f}"),
+    ("messages", "msgs", "{:>5}"),
+    ("embeds", "embeds", "{:>6}"),
+    ("peak_mib", "peak MiB", "{:>9.1f}"),
+)
+
+
+def _cell(fmt: str, value) -> str:
+    # 計測していない値（--memory なしのピークメモリ）は 0 ではなく "-" と表示する
+    return fmt.format(value) if value is not None else "-".rjust(len(fmt.format(0)))
+
+
+def print_table(rows: list[dict]) -> None:
+    header = " ".join(f"{title:>{len(fmt.format(0))}}" for _, title, fmt in COLUMNS)
+    print(header)
+    for row in rows:
+        print(" ".join(_cell(fmt, row[key]) for key, _, fmt in COLUMNS))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="ローカルのフィードサーバーと偽チャンネルで bot.py を計測する")
+    parser.add_argument("--feeds", default="9,100,1000", help="フィード数 (カンマ区切り)")
+    parser.add_argument("--items", default="20", help="1フィードあたりの記事数 (カンマ区切り)")
+    parser.add_argument("--latency", type=float, default=20, help="サーバー応答の遅延 (ミリ秒)")
+    parser.add_argument("--hosts", type=int, default=8, help="配信に使うループバックアドレス数 (ホスト単位の制限を模す)")
+    parser.add_argument("--channels", type=int, default=10, help="fanout シナリオの配信先チャンネル数")
+    parser.add_argument("--fixtures", help="記録済みフィードのディレクトリ（指定時は生成の代わりに配信）")
+    parser.add_argument("--memory", action="store_true", help="tracemalloc でピークメモリを計測する（遅くなる）")
+    args = parser.parse_args()
+
+    print_table(asyncio.run(run_all(args)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,16 +7,36 @@ IT News Discord Bot
 """
 
 import asyncio
+import bisect
+import calendar
+import heapq
 import hashlib
+import importlib.util
+import itertools
 import json
 import os
+import random
+import re
+import sqlite3
 import time
+import unicodedata
+import xml.etree.ElementTree as ET
+from functools import lru_cache
+from collections import deque
+from contextlib import aclosing
+from concurrent.futures import Executor, ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta, time
+from email.utils import parsedate_to_datetime
 from pathlib import Path
+from statistics import median
+from time import monotonic, perf_counter, thread_time
+from typing import Callable
+from urllib.parse import parse_qsl, urlencode, urlparse, urlsplit
+
+PROCESS_STARTED = perf_counter()   # 起動時間の計測起点（重いライブラリの読み込みを含める）
 
 import aiohttp
 import discord
-import feedparser
 from discord.ext import commands, tasks
 from dotenv import load_dotenv
 
@@ -24,8 +44,44 @@ from dotenv import load_dotenv
 load_dotenv()
 
 TOKEN = os.getenv("DISCORD_TOKEN")
+WEBHOOK_URL = os.getenv("DISCORD_WEBHOOK_URL", "")   # --once / --digest / --ranking の投稿先
 CHANNEL_ID = int(os.getenv("DISCORD_CHANNEL_ID", "0"))
 CHECK_INTERVAL_MINUTES = int(os.getenv("CHECK_INTERVAL_MINUTES", "30"))
+POLL_MIN_MINUTES = int(os.getenv("POLL_MIN_MINUTES", "5"))     # 適応ポーリング間隔の下限
+POLL_MAX_MINUTES = int(os.getenv("POLL_MAX_MINUTES", "180"))   # 適応ポーリング間隔の上限
+POLL_JITTER = float(os.getenv("POLL_JITTER", "0.1"))           # 間隔に加える揺らぎ (±割合)
+POLL_MORNING_FEEDS = os.getenv("POLL_MORNING_FEEDS", "0") == "1"  # 朝のまとめ対象フィードも随時投稿する
+FETCH_CONCURRENCY = int(os.getenv("FETCH_CONCURRENCY", "8"))   # 同時取得するフィード数の上限
+FETCH_PER_HOST = int(os.getenv("FETCH_PER_HOST", "2"))         # 同一ホストへの同時接続数の上限
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "32"))      # 共有コネクションプール全体の上限
+HTTP_KEEPALIVE_SECONDS = float(os.getenv("HTTP_KEEPALIVE_SECONDS", "75"))
+HTTP_DNS_TTL_SECONDS = int(os.getenv("HTTP_DNS_TTL_SECONDS", "600"))
+PARSE_EXECUTOR = os.getenv("PARSE_EXECUTOR", "thread")         # "thread" または "process"
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "2"))
+PARSE_QUEUE_SIZE = int(os.getenv("PARSE_QUEUE_SIZE", "4"))     # ワーカーへ同時に投入するパース数の上限
+PARSE_INLINE_SIZE = int(os.getenv("PARSE_INLINE_SIZE", "16384"))  # これ未満の文字数はループ上で直接パース
+STREAM_PARSE = os.getenv("STREAM_PARSE", "1") == "1"           # 既読記事に達したら読み込みを打ち切る
+STREAM_STOP_AFTER_KNOWN = int(os.getenv("STREAM_STOP_AFTER_KNOWN", "3"))  # 打ち切りまでに連続する既読件数
+FETCH_RETRIES = int(os.getenv("FETCH_RETRIES", "2"))           # 一時的なエラーの再試行回数
+FETCH_BACKOFF_BASE = float(os.getenv("FETCH_BACKOFF_BASE", "1"))    # 再試行待ちの基準秒数（指数的に延ばす）
+FETCH_BACKOFF_MAX = float(os.getenv("FETCH_BACKOFF_MAX", "10"))
+FETCH_CONNECT_TIMEOUT = float(os.getenv("FETCH_CONNECT_TIMEOUT", "10"))
+FETCH_READ_TIMEOUT = float(os.getenv("FETCH_READ_TIMEOUT", "20"))
+FETCH_TOTAL_TIMEOUT = float(os.getenv("FETCH_TOTAL_TIMEOUT", "60"))   # 1回のリクエスト全体（本文の読み込みまで）の上限
+BREAKER_THRESHOLD = int(os.getenv("BREAKER_THRESHOLD", "3"))   # 連続失敗がこの回数に達したらホストを遮断
+BREAKER_COOLDOWN_SECONDS = float(os.getenv("BREAKER_COOLDOWN_SECONDS", "300"))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "8"))  # パイプラインの段の間に溜められる件数
+SEND_CONCURRENCY = int(os.getenv("SEND_CONCURRENCY", "4"))     # 同時に投稿処理するフィード数
+SEND_BURST = int(os.getenv("SEND_BURST", "5"))                 # チャンネルごとのトークンバケット容量
+SEND_PER_SECOND = float(os.getenv("SEND_PER_SECOND", "1"))     # トークンの補充速度 (件/秒)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))          # 0 で Prometheus エンドポイントを無効化
+DEDUP_WINDOW_HOURS = float(os.getenv("DEDUP_WINDOW_HOURS", "48"))  # フィード横断の重複判定に使う期間 (0 で無効)
+DEDUP_TITLE_DISTANCE = int(os.getenv("DEDUP_TITLE_DISTANCE", "3"))  # 同一記事とみなすタイトル SimHash のハミング距離
+KEYWORD_WEIGHTS = os.getenv("KEYWORD_WEIGHTS", "")               # 例: "AI=2,脆弱性=3" (ホットキーワードの重み上書き・追加)
+ARCHIVE_RETENTION_DAYS = int(os.getenv("ARCHIVE_RETENTION_DAYS", "180"))  # 記事アーカイブの保持日数 (0 で無期限)
+SHARDED = os.getenv("SHARDED", "0") == "1"                     # AutoShardedBot でシャードに分けて接続する
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0"))               # シャード数 (0 で Discord の推奨値)
 
 # RSSフィード定義
 RSS_FEEDS = [
@@ -35,18 +91,21 @@ RSS_FEEDS = [
         "url": "https://zenn.dev/feed",
         "color": 0x3EA8FF,   # Zenn ブルー
         "icon": "https://zenn.dev/images/logo-transparent.png",
+        "bonus": 1,          # 注目記事選びのスコア加点（エンジニア向け特化）
     },
     {
         "name": "Qiita トレンド",
         "url": "https://qiita.com/popular-items/feed",
         "color": 0x55C500,   # Qiita グリーン
         "icon": "https://cdn.qiita.com/assets/favicons/public/icon-plain.ico",
+        "bonus": 1,
     },
     {
         "name": "はてなブックマーク IT",
         "url": "https://b.hatena.ne.jp/hotentry/it.rss",
         "color": 0x00A4DE,   # はてなブルー
         "icon": "https://b.hatena.ne.jp/favicon.ico",
+        "ranking": True,     # ブックマーク数を記録してランキングを集計する（購読先がなくても巡回する）
     },
     {
         "name": "CodeZine 新着記事",
@@ -84,29 +143,477 @@ RSS_FEEDS = [
         "url": "https://gigazine.net/news/rss_2.0/",
         "color": 0x333333,   # GIGAZINE ブラック
         "icon": "https://gigazine.net/favicon.ico",
-        # dc:subject でIT系カテゴリのみに絞る
-        "categories": {"AI", "ソフトウェア", "ハードウェア", "セキュリティ", "ネットサービス", "ウェブアプリ"},
+        # dc:subject でIT系カテゴリのみに絞る（書式は「フィルタールール」を参照）
+        "filter": {
+            "include_categories": ["AI", "ソフトウェア", "ハードウェア", "セキュリティ", "ネットサービス", "ウェブアプリ"],
+        },
     },
 ]
 
-# 既読管理ファイル
+# 既読管理DB (旧形式の JSON は初回起動時に移行する)
+SEEN_DB_FILE = Path(__file__).parent / "seen_articles.db"
 SEEN_FILE = Path(__file__).parent / "seen_articles.json"
+SEEN_TRIM_AT = 500   # フィードごとの既読件数がこれを超えたら
+SEEN_KEEP = 300      # 新しい順にこの件数だけ残す
+# 取得した全記事のアーカイブ (全文検索用)
+ARCHIVE_DB_FILE = Path(__file__).parent / "articles.db"
+
+# はてなブックマーク数の推移 (ランキング集計用)
+BOOKMARKS_DB_FILE = Path(__file__).parent / "bookmarks.db"
+
+# 条件付きGET用キャッシュ (URLごとに ETag / Last-Modified と最終レスポンス本文を1ファイルで持つ)
+HTTP_CACHE_DIR = Path(__file__).parent / "http_cache"
+
+# 配信先ルーティング表 (なければ DISCORD_CHANNEL_ID にすべて投稿する)
+ROUTES_FILE = Path(os.getenv("ROUTES_FILE", Path(__file__).parent / "routes.json"))
+
+
+# ── メトリクス ────────────────────────────────────────────
+class Counter:
+    """ラベル付きカウンター"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1.0) -> None:
+        self.values[label_values] = self.values.get(label_values, 0.0) + amount
+
+    def samples(self):
+        for label_values, value in self.values.items():
+            yield self.name, dict(zip(self.labels, label_values)), value
+
+
+class Histogram:
+    """ラベル付きヒストグラム。記録時は該当バケットを1つ数えるだけで、累積は出力時に行う"""
+
+    kind = "histogram"
+    BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.values: dict[tuple, list] = {}   # ラベル値 -> [バケットごとの件数..., 合計, 件数]
+
+    def observe(self, value: float, *label_values: str) -> None:
+        series = self.values.get(label_values)
+        if series is None:
+            series = self.values[label_values] = [0] * (len(self.BUCKETS) + 1) + [0.0, 0]
+        series[bisect.bisect_left(self.BUCKETS, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def summary(self, *label_values: str) -> tuple[int, float, float]:
+        """(件数, 平均, 概算 p95) を返す"""
+        series = self.values.get(label_values)
+        if not series or not series[-1]:
+            return 0, 0.0, 0.0
+        count = series[-1]
+        running = 0
+        p95 = self.BUCKETS[-1]
+        for bound, n in zip(self.BUCKETS, series):
+            running += n
+            if running >= count * 0.95:
+                p95 = bound
+                break
+        return count, series[-2] / count, p95
+
+    def samples(self):
+        for label_values, series in self.values.items():
+            labels = dict(zip(self.labels, label_values))
+            running = 0
+            for bound, n in zip(self.BUCKETS + (float("inf"),), series):
+                running += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield f"{self.name}_bucket", {**labels, "le": le}, running
+            yield f"{self.name}_sum", labels, series[-2]
+            yield f"{self.name}_count", labels, series[-1]
+
+
+class CallbackMetric:
+    """出力時にコールバックで値を集めるメトリクス（記録側のコストはゼロ）。
+
+    collect は {ラベル値のタプル: 値} を返す。既存の統計値をそのまま公開するのに使う。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: tuple[str, ...],
+        collect: Callable[[], dict],
+        kind: str = "gauge",
+    ):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.collect = collect
+        self.kind = kind
+
+    def samples(self):
+        for label_values, value in self.collect().items():
+            yield self.name, dict(zip(self.labels, label_values)), value
+
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: list = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Prometheus テキスト形式で出力する"""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                if labels:
+                    rendered = ",".join(f'{k}="{_escape_label(v)}"' for k, v in labels.items())
+                    lines.append(f"{name}{{{rendered}}} {value}")
+                else:
+                    lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+STAGE_SECONDS = metrics.register(
+    Histogram("newsbot_stage_seconds", "パイプライン各段の所要時間", ("stage", "feed"))
+)
+FEED_BYTES = metrics.register(Counter("newsbot_feed_bytes_total", "フィードから受信したバイト数", ("feed",)))
+FEED_ENTRIES = metrics.register(Counter("newsbot_feed_entries_total", "フィードから得たエントリ数", ("feed",)))
+FEED_ERRORS = metrics.register(Counter("newsbot_feed_errors_total", "フィード取得の失敗回数", ("feed",)))
+PARSE_CPU = metrics.register(
+    Counter("newsbot_parse_cpu_seconds_total", "フィードのパースに使った CPU 時間（待ち時間を含まない）", ("feed",))
+)
+ARTICLES_POSTED = metrics.register(Counter("newsbot_articles_posted_total", "投稿した記事数", ("feed",)))
+EMBEDS_FAILED = metrics.register(
+    Counter("newsbot_embeds_failed_total", "送信できなかった Embed 数（分割して送れた分は含まない）", ("channel",))
+)
+DUPLICATES = metrics.register(
+    Counter("newsbot_duplicates_total", "他フィードと重複して投稿を見送った記事数", ("feed", "reason"))
+)
+LOOP_LAG = metrics.register(Histogram("newsbot_event_loop_lag_seconds", "イベントループの遅延"))
+
+# URL → フィード名（メトリクスのラベル用。fetch_feeds が登録する）
+_feed_names: dict[str, str] = {}
+
+
+def feed_label(url: str) -> str:
+    return _feed_names.get(url, url)
+
+
+class stage_timer:
+    """with ブロックの所要時間を newsbot_stage_seconds に記録する"""
+
+    __slots__ = ("stage", "feed", "start")
+
+    def __init__(self, stage: str, feed: str):
+        self.stage = stage
+        self.feed = feed
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        STAGE_SECONDS.observe(perf_counter() - self.start, self.stage, self.feed)
+        return False
+
+
+async def sample_loop_lag(interval: float = 1.0) -> None:
+    """一定間隔で sleep し、予定より遅れて起きた分をイベントループの遅延として記録する"""
+    while True:
+        start = monotonic()
+        await asyncio.sleep(interval)
+        LOOP_LAG.observe(max(monotonic() - start - interval, 0.0))
+
+
+async def start_metrics_server():
+    """Prometheus 形式のメトリクスを localhost で公開する。METRICS_PORT=0 なら何もしない"""
+    if not METRICS_PORT:
+        return None
+    from aiohttp import web
+
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, METRICS_HOST, METRICS_PORT).start()
+    except OSError as e:
+        print(f"[WARN] メトリクスサーバーを起動できません: {e}")
+        await runner.cleanup()
+        return None
+    print(f"📈 メトリクス: http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    return runner
 
 
 # ── 既読管理 ──────────────────────────────────────────────
-def load_seen() -> dict[str, list[str]]:
-    """既に投稿済みの記事IDを読み込む"""
-    if SEEN_FILE.exists():
-        try:
-            return json.loads(SEEN_FILE.read_text(encoding="utf-8"))
-        except (json.JSONDecodeError, OSError):
-            pass
-    return {}
+class SeenStore:
+    """投稿済みの記事IDを SQLite (WAL) に保存し、メモリ上のセットで照会する。
 
+    add() した ID は即座に既読扱いになり、commit() で1トランザクションにまとめて書き込む。
+    同じDBに送信箱 (outbox) を持ち、送る前のメッセージを stage() で記録しておく。
+    送信結果は ack() で受け取り、既読の書き込みと同じ commit() でまとめて確定する。
+    送信中の記事は既読扱いにするので、並行する巡回で二重に選ばれない。
+    """
 
-def save_seen(seen: dict[str, list[str]]) -> None:
-    """投稿済みの記事IDを保存する"""
-    SEEN_FILE.write_text(json.dumps(seen, ensure_ascii=False, indent=2), encoding="utf-8")
+    def __init__(self, path: Path, legacy_path: Path | None = None):
+        self.path = path
+        self.legacy_path = legacy_path
+        self._db: sqlite3.Connection | None = None
+        self._index: dict[str, set[str]] = {}
+        self._pending: list[tuple[str, str]] = []
+        # 送信箱: nonce → Embed ごとの (既読キー, 記事ID) の一覧
+        self._inflight: dict[str, list[list[tuple[str, str]]]] = {}
+        self._settled: list[str] = []
+        self._recovered: list[str] = []   # 前回の実行で送信結果が確定しなかったメッセージ
+        self._meta: dict[str, str] = {}
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = sqlite3.connect(self.path)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS seen ("
+                " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " feed TEXT NOT NULL,"
+                " aid TEXT NOT NULL,"
+                " UNIQUE (feed, aid))"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS outbox ("
+                " nonce TEXT PRIMARY KEY,"
+                " channel INTEGER NOT NULL,"
+                " items TEXT NOT NULL,"
+                " payload TEXT NOT NULL,"
+                " created REAL NOT NULL)"
+            )
+            self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self._db.commit()
+            self._migrate_legacy()
+            for feed, aid in self._db.execute("SELECT feed, aid FROM seen"):
+                self._index.setdefault(feed, set()).add(aid)
+            for nonce, items in self._db.execute("SELECT nonce, items FROM outbox ORDER BY created"):
+                self._track(nonce, [[tuple(item) for item in group] for group in json.loads(items)])
+                self._recovered.append(nonce)
+        return self._db
+
+    def _migrate_legacy(self) -> None:
+        """旧 seen_articles.json の内容を取り込み、ファイルを退避する"""
+        if self.legacy_path is None or not self.legacy_path.exists():
+            return
+        try:
+            legacy = json.loads(self.legacy_path.read_text(encoding="utf-8"))
+        except (json.JSONDecodeError, OSError):
+            return
+        with self._db:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO seen (feed, aid) VALUES (?, ?)",
+                [(feed, aid) for feed, aids in legacy.items() for aid in aids],
+            )
+        self.legacy_path.rename(self.legacy_path.with_suffix(".json.migrated"))
+        print(f"[INFO] 既読データを {self.path.name} に移行しました")
+
+    def _ids(self, feed: str) -> set[str]:
+        self.db  # 初回アクセス時にDBを開いてインデックスを構築する
+        return self._index.setdefault(feed, set())
+
+    def is_seen(self, feed: str, aid: str) -> bool:
+        return aid in self._ids(feed)
+
+    def has_feed(self, feed: str) -> bool:
+        """そのフィードの既読記事が1件でもあるか"""
+        return bool(self._ids(feed))
+
+    def count(self, feed: str) -> int:
+        return len(self._ids(feed))
+
+    def add(self, feed: str, aid: str) -> None:
+        """記事IDを既読にする（commit() まで書き込みは保留）"""
+        ids = self._ids(feed)
+        if aid not in ids:
+            ids.add(aid)
+            self._pending.append((feed, aid))
+
+    def _track(self, nonce: str, items: list[list[tuple[str, str]]]) -> None:
+        self._inflight[nonce] = items
+        for group in items:
+            for feed, aid in group:
+                self._index.setdefault(feed, set()).add(aid)
+
+    def stage(self, messages: list[tuple[str, int, list[list[tuple[str, str]]], str]]) -> None:
+        """送る前のメッセージ (nonce, チャンネルID, Embed ごとの記事, Embed の一覧の JSON) を送信箱に書き込む"""
+        messages = [m for m in messages if m[0] not in self._inflight]
+        if not messages:
+            return
+        now = datetime.now(timezone.utc).timestamp()
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO outbox (nonce, channel, items, payload, created) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (nonce, channel_id, json.dumps(items, ensure_ascii=False), payload, now)
+                    for nonce, channel_id, items, payload in messages
+                ],
+            )
+        for nonce, _, items, _ in messages:
+            self._track(nonce, items)
+
+    def ack(self, nonce: str, sent: list[bool]) -> None:
+        """送信結果を受け取る。送れた Embed の記事は既読に、送れなかった記事は未読に戻す（確定は commit()）"""
+        items = self._inflight.pop(nonce, None)
+        if items is None:
+            return
+        self._settled.append(nonce)
+        failed = []
+        for group, ok in zip(items, sent):
+            if ok:
+                self._pending.extend(group)
+            else:
+                failed.extend(group)
+        if failed:
+            # 別のメッセージで送れた記事・送信中の記事はそちらの結果に任せる
+            busy = set(self._pending)
+            busy.update(item for groups in self._inflight.values() for group in groups for item in group)
+            for feed, aid in failed:
+                if (feed, aid) not in busy:
+                    self._index[feed].discard(aid)
+
+    def split(self, nonce: str, at: int) -> tuple[str, str]:
+        """送信箱のメッセージを at 番目の Embed の前で2つに分け、それぞれ別の nonce で記録し直す"""
+        first, second = nonce + "0", nonce + "1"
+        items = self._inflight.pop(nonce, None)
+        if items is None:
+            return first, second
+        channel_id, payload, created = self.db.execute(
+            "SELECT channel, payload, created FROM outbox WHERE nonce = ?", (nonce,)
+        ).fetchone()
+        payload = json.loads(payload)
+        with self.db:
+            self.db.execute("DELETE FROM outbox WHERE nonce = ?", (nonce,))
+            self.db.executemany(
+                "INSERT OR REPLACE INTO outbox (nonce, channel, items, payload, created) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (child, channel_id, json.dumps(part_items, ensure_ascii=False),
+                     json.dumps(part_payload, ensure_ascii=False), created)
+                    for child, part_items, part_payload in (
+                        (first, items[:at], payload[:at]), (second, items[at:], payload[at:]),
+                    )
+                ],
+            )
+        self._inflight[first] = items[:at]
+        self._inflight[second] = items[at:]
+        return first, second
+
+    def recovered(self, channel_ids=None) -> list[tuple[str, int, list[list[tuple[str, str]]], list[dict]]]:
+        """前回の実行で送信結果が確定しなかったメッセージを返す（1回だけ）。
+
+        channel_ids を渡すとそのチャンネル宛てのものだけを返し、残りは次回に回す。
+        """
+        self.db
+        messages = []
+        remaining = []
+        for nonce in self._recovered:
+            row = self.db.execute("SELECT channel, items, payload FROM outbox WHERE nonce = ?", (nonce,)).fetchone()
+            if row is None or nonce not in self._inflight:
+                continue
+            if channel_ids is not None and row[0] not in channel_ids:
+                remaining.append(nonce)
+                continue
+            messages.append((nonce, row[0], self._inflight[nonce], json.loads(row[2])))
+        self._recovered = remaining
+        return messages
+
+    def get_meta(self, key: str) -> str | None:
+        """最終まとめ投稿日などの状態値を返す"""
+        if key in self._meta:
+            return self._meta[key]
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        """状態値を記録する（既読と同じ commit() で書き込む）"""
+        self._meta[key] = value
+
+    def outbox_size(self) -> int:
+        """送信結果待ちのメッセージ数"""
+        return len(self._inflight)
+
+    def commit(self) -> None:
+        """保留中の既読IDと送信結果をまとめて書き込み、件数超過のフィードを切り詰める"""
+        if not self._pending and not self._settled and not self._meta:
+            return
+        feeds = {feed for feed, _ in self._pending}
+        with self.db:
+            self.db.executemany("INSERT OR IGNORE INTO seen (feed, aid) VALUES (?, ?)", self._pending)
+            self.db.executemany("DELETE FROM outbox WHERE nonce = ?", [(nonce,) for nonce in self._settled])
+            self.db.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", self._meta.items())
+            for feed in feeds:
+                if len(self._index[feed]) > SEEN_TRIM_AT:
+                    self.db.execute(
+                        "DELETE FROM seen WHERE feed = ? AND seq NOT IN"
+                        " (SELECT seq FROM seen WHERE feed = ? ORDER BY seq DESC LIMIT ?)",
+                        (feed, feed, SEEN_KEEP),
+                    )
+                    self._index[feed] = {
+                        aid for (aid,) in self.db.execute("SELECT aid FROM seen WHERE feed = ?", (feed,))
+                    }
+                    # 送信中の記事は切り詰めの対象外
+                    self._index[feed].update(
+                        aid for groups in self._inflight.values() for group in groups for key, aid in group if key == feed
+                    )
+        self._pending.clear()
+        self._settled.clear()
+        self._meta.clear()
+
+    def sizes(self) -> dict[str, int]:
+        """フィードごとの既読件数"""
+        self.db
+        return {feed: len(ids) for feed, ids in self._index.items()}
+
+    def reset(self) -> None:
+        """既読データをすべて削除する"""
+        with self.db:
+            self.db.execute("DELETE FROM seen")
+            self.db.execute("DELETE FROM outbox")
+        self._index.clear()
+        self._pending.clear()
+        self._inflight.clear()
+        self._settled.clear()
+        self._recovered.clear()
+
+
+seen_store = SeenStore(SEEN_DB_FILE, legacy_path=SEEN_FILE)
+metrics.register(CallbackMetric(
+    "newsbot_seen_ids", "既読ストアに保持している記事ID数", ("feed",),
+    lambda: {(feed,): n for feed, n in seen_store.sizes().items()},
+))
+metrics.register(CallbackMetric(
+    "newsbot_outbox_pending", "送信箱で送信結果を待っているメッセージ数", (), lambda: {(): seen_store.outbox_size()},
+))
+
+
+def outbox_nonce(channel_id: int, items: list[list[tuple[str, str]]]) -> str:
+    """宛先と記事から決まるメッセージの nonce（Discord の上限 25 文字に分割用の余白を残す）"""
+    raw = f"{channel_id}|" + "|".join(f"{feed}/{aid}" for group in items for feed, aid in group)
+    return hashlib.blake2b(raw.encode(), digest_size=10).hexdigest()
 
 
 def article_id(entry: dict) -> str:
@@ -115,74 +622,1386 @@ def article_id(entry: dict) -> str:
     return hashlib.sha256(raw.encode()).hexdigest()[:16]
 
 
+# ── 記事レコード ──────────────────────────────────────────
+_HTML_TAG = re.compile(r"<[^>]+>")
+SUMMARY_LIMIT = 200
+
+
+class Article:
+    """Bot が使う項目だけを持つ記事レコード。
+
+    feedparser のエントリ（生の HTML や名前空間ごとの項目を丸ごと持つ辞書）はパース直後にこれへ変換して手放す。
+    """
+
+    __slots__ = ("id", "title", "link", "summary", "published", "author", "thumbnail", "categories", "bookmarks")
+
+    def __init__(
+        self,
+        id: str,
+        title: str = "",
+        link: str = "",
+        summary: str = "",
+        published: float | None = None,
+        author: str = "",
+        thumbnail: str = "",
+        categories: tuple[str, ...] = (),
+        bookmarks: int | None = None,
+    ):
+        self.id = id
+        self.title = title
+        self.link = link
+        self.summary = summary
+        self.published = published
+        self.author = author
+        self.thumbnail = thumbnail
+        self.categories = categories
+        self.bookmarks = bookmarks
+
+    @classmethod
+    def from_entry(cls, entry: dict) -> "Article":
+        """feedparser のエントリから必要な項目だけを取り出す"""
+        # HTMLタグを簡易除去して Embed に載せる長さに切り詰める
+        summary = _HTML_TAG.sub("", entry.get("summary", entry.get("description", "")))
+        if len(summary) > SUMMARY_LIMIT:
+            summary = summary[:SUMMARY_LIMIT] + "…"
+
+        stamp = entry.get("published_parsed") or entry.get("updated_parsed")
+        published = float(calendar.timegm(stamp)) if stamp else None
+
+        # サムネイル (はてブにはenclosureが含まれることがある)
+        thumbnail = ""
+        if entry.get("media_thumbnail"):
+            thumbnail = entry["media_thumbnail"][0].get("url", "")
+        elif entry.get("enclosures"):
+            enc = entry["enclosures"][0]
+            if enc.get("type", "").startswith("image"):
+                thumbnail = enc.get("href", "")
+
+        # feedparserはdc:subjectをtagsに格納する（カンマ区切り文字列の場合あり）
+        categories = tuple(
+            part.strip()
+            for tag in entry.get("tags", ())
+            for part in (tag.get("term") or "").split(",")
+            if part.strip()
+        )
+
+        try:
+            bookmarks = int(entry.get("hatena_bookmarkcount"))
+        except (TypeError, ValueError):
+            bookmarks = None
+
+        return cls(
+            id=article_id(entry),
+            title=entry.get("title", ""),
+            link=entry.get("link", ""),
+            summary=summary,
+            published=published,
+            author=entry.get("author", ""),
+            thumbnail=thumbnail,
+            categories=categories,
+            bookmarks=bookmarks,
+        )
+
+    def __repr__(self) -> str:
+        return f"Article(id={self.id!r}, title={self.title!r})"
+
+
+class ParsedFeed(dict):
+    """フィードの取得結果。feedparser の FeedParserDict と同じく feed.entries でもキーでも参照できる"""
+
+    def __getattr__(self, name: str):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+
+# ── フィード横断の重複検出 ────────────────────────────────
+# クエリから取り除く計測用パラメータ
+_TRACKING_PARAMS = {
+    "fbclid", "gclid", "dclid", "msclkid", "yclid", "igshid", "mc_cid", "mc_eid",
+    "ref_src", "_hsenc", "_hsmi", "spm",
+}
+# 別URLを包んでいるリダイレクタ (ホスト → 本来のURLを持つクエリパラメータ)
+_REDIRECT_PARAMS = {
+    "www.google.com": "url", "google.com": "url", "l.facebook.com": "u",
+    "t.umblr.com": "z", "news.google.com": "url",
+}
+_HATENA_ENTRY = re.compile(r"^/entry/(?:(s)/)?(.+)$")
+# タイトル末尾に付くサイト名（フィード名とその先頭語に加え、転載元によく付くもの）。
+# 任意の短い末尾を消すと「… - 上級」「… - 初級」のような連載の別記事が同じタイトルになるため、既知の名前だけを除く
+_SITE_NAMES = {
+    "qiita", "zenn", "publickey", "itmedia", "itmedia news", "@it", "gihyo.jp", "技術評論社",
+    "gigazine", "codezine", "はてなブックマーク", "note", "speaker deck", "developersio",
+} | {
+    name for feed_meta in RSS_FEEDS
+    for name in (unicodedata.normalize("NFKC", feed_meta["name"]).lower(),
+                 unicodedata.normalize("NFKC", feed_meta["name"]).lower().split()[0])
+}
+_TITLE_SUFFIX = re.compile(
+    r"(?:\s+[-–—]\s+|\s*[|｜]\s*)(?:"
+    + "|".join(re.escape(name) for name in sorted(_SITE_NAMES, key=len, reverse=True))
+    + r")\s*$"
+)
+_TITLE_NOISE = re.compile(r"[\W_]+")
+_TITLE_NUMBERS = re.compile(r"\d+")
+
+
+@lru_cache(maxsize=4096)
+def canonical_url(url: str) -> str:
+    """比較用にURLを正規化する（スキームと計測用パラメータを除き、リダイレクタを外す）"""
+    for _ in range(3):   # 入れ子のリダイレクタも外す
+        parts = urlsplit(url.strip())
+        host = (parts.hostname or "").lower()
+        if host == "b.hatena.ne.jp":
+            match = _HATENA_ENTRY.match(parts.path)
+            if match:
+                url = ("https://" if match.group(1) else "http://") + match.group(2)
+                continue
+        param = _REDIRECT_PARAMS.get(host)
+        if param:
+            target = dict(parse_qsl(parts.query)).get(param)
+            if target:
+                url = target
+                continue
+        break
+
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or "").lower().removeprefix("www.")
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+    path = re.sub(r"/{2,}", "/", parts.path)
+    path = path.removesuffix("/index.html").rstrip("/") or "/"
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.startswith("utm_") and k not in _TRACKING_PARAMS
+    )
+    return f"{host}{path}" + (f"?{urlencode(query)}" if query else "")
+
+
+@lru_cache(maxsize=4096)
+def title_signature(title: str) -> tuple[int, tuple[str, ...]] | None:
+    """タイトルの文字3-gramの64ビット SimHash と、含まれる数字列を返す。短すぎるタイトルは None。
+
+    数字だけが違うタイトル（「v1.2 リリース」と「v1.3 リリース」など）は別記事として扱うため、数字列も比較に使う。
+    """
+    text = unicodedata.normalize("NFKC", title).lower()
+    text = _TITLE_NOISE.sub("", _TITLE_SUFFIX.sub("", text))
+    if len(text) < 8:
+        return None
+    hashes = {
+        format(int.from_bytes(hashlib.blake2b(text[i:i + 3].encode(), digest_size=8).digest(), "big"), "064b")
+        for i in range(len(text) - 2)
+    }
+    # ビットごとに多数決をとる（文字列の列を数えることでループを C 側に任せる）
+    half = len(hashes) / 2
+    fingerprint = int("".join("1" if column.count("1") > half else "0" for column in zip(*hashes)), 2)
+    return fingerprint, tuple(_TITLE_NUMBERS.findall(text))
+
+
+class DuplicateIndex:
+    """最近投稿した記事の正規化URLとタイトル SimHash を期間限定で保持し、他フィードの同一記事を見つける。
+
+    SimHash は max_distance + 1 個の帯に分けて索引する（距離が max_distance 以下なら
+    少なくとも1つの帯が一致する）ので、照会は帯の一致した候補との比較だけで済む。
+    scope ごとに独立しており、配信先ごとの既読と同じ単位で判定する。
+    """
+
+    def __init__(self, window_seconds: float, max_distance: int):
+        self.window = window_seconds
+        self.max_distance = max_distance
+        self.bands = max_distance + 1
+        self.band_bits = 64 // self.bands
+        self._urls: dict[tuple, tuple] = {}
+        self._titles: dict[tuple, list[tuple]] = {}
+        self._claimed: set[tuple[str, str]] = set()
+        self._order: deque[tuple] = deque()
+
+    def _band_keys(self, scope: str, fingerprint: int) -> list[tuple]:
+        mask = (1 << self.band_bits) - 1
+        return [(scope, i, (fingerprint >> (i * self.band_bits)) & mask) for i in range(self.bands)]
+
+    def _expire(self, now: float) -> None:
+        while self._order and self._order[0][0] <= now:
+            record = self._order.popleft()
+            _, scope, aid, _, url, _, band_keys = record
+            self._claimed.discard((scope, aid))
+            if self._urls.get((scope, url)) is record:
+                del self._urls[(scope, url)]
+            for key in band_keys:
+                bucket = self._titles.get(key)
+                if bucket is not None:
+                    bucket.remove(record)
+                    if not bucket:
+                        del self._titles[key]
+
+    def claim(
+        self, scope: str, feed_name: str, aid: str, entry: Article, age: float = 0.0,
+    ) -> tuple[str, str] | None:
+        """記事を登録する。既に別の記事として登録済みなら (先に登録したフィード名, 理由) を返す。
+
+        age は起動時に過去の投稿を復元する場合の経過秒数（古い順に登録すること）。
+        """
+        if self.window <= 0 or age >= self.window:
+            return None
+        now = monotonic()
+        self._expire(now)
+        if (scope, aid) in self._claimed:
+            return None
+
+        url = canonical_url(entry.link) if entry.link else ""
+        if url:
+            record = self._urls.get((scope, url))
+            if record is not None:
+                return record[3], "url"
+
+        signature = title_signature(entry.title)
+        band_keys = []
+        if signature is not None:
+            fingerprint, numbers = signature
+            band_keys = self._band_keys(scope, fingerprint)
+            for key in band_keys:
+                for record in self._titles.get(key, ()):
+                    other, other_numbers = record[5]
+                    if other_numbers == numbers and (other ^ fingerprint).bit_count() <= self.max_distance:
+                        return record[3], "title"
+
+        record = (now - age + self.window, scope, aid, feed_name, url, signature, band_keys)
+        self._order.append(record)
+        self._claimed.add((scope, aid))
+        if url:
+            self._urls[(scope, url)] = record
+        for key in band_keys:
+            self._titles.setdefault(key, []).append(record)
+        return None
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+
+duplicate_index = DuplicateIndex(DEDUP_WINDOW_HOURS * 3600, DEDUP_TITLE_DISTANCE)
+metrics.register(CallbackMetric(
+    "newsbot_duplicate_index_size", "重複検出の索引に保持している記事数", (), lambda: {(): len(duplicate_index)},
+))
+
+
+# ── 記事アーカイブ ────────────────────────────────────────
+def _like_pattern(term: str) -> str:
+    """LIKE 用にワイルドカード文字をエスケープした部分一致パターン"""
+    return "%" + re.sub(r"([\\%_])", r"\\\1", term) + "%"
+
+
+class ArticleArchive:
+    """取得した記事を SQLite に保存し、FTS5 (trigram) で全文検索する。
+
+    add() した記事は commit() で1トランザクションにまとめて書き込む。
+    trigram は3文字以上の語しか索引で引けないため、短い語は LIKE で絞り込む。
+    保持期間を過ぎた記事は1日1回 compact() で削除する（前回の時刻は DB に記録し、再起動をまたいで数える）。
+    """
+
+    COMPACT_INTERVAL = 24 * 3600
+
+    def __init__(self, path: Path, retention_days: int):
+        self.path = path
+        self.retention = retention_days * 86400
+        self.rows = 0
+        self._db: sqlite3.Connection | None = None
+        self._pending: list[tuple] = []
+        self._compacted_at = 0.0   # 前回 compact() した UNIX 時刻（DB を開いた時に読み込む）
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = sqlite3.connect(self.path)
+            # 削除で空いたページを compact() で返せるよう、テーブル作成前に設定する
+            self._db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(
+                "CREATE TABLE IF NOT EXISTS articles ("
+                " id INTEGER PRIMARY KEY,"
+                " feed TEXT NOT NULL,"
+                " aid TEXT NOT NULL,"
+                " title TEXT NOT NULL,"
+                " link TEXT NOT NULL,"
+                " summary TEXT NOT NULL,"
+                " author TEXT NOT NULL,"
+                " published REAL,"
+                " fetched REAL NOT NULL,"
+                " UNIQUE (feed, aid));"
+                "CREATE INDEX IF NOT EXISTS articles_fetched ON articles (fetched);"
+                "CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5("
+                " title, summary, content='articles', content_rowid='id', tokenize='trigram');"
+                "CREATE TRIGGER IF NOT EXISTS articles_ai AFTER INSERT ON articles BEGIN"
+                " INSERT INTO articles_fts (rowid, title, summary) VALUES (new.id, new.title, new.summary);"
+                " END;"
+                "CREATE TRIGGER IF NOT EXISTS articles_ad AFTER DELETE ON articles BEGIN"
+                " INSERT INTO articles_fts (articles_fts, rowid, title, summary)"
+                " VALUES ('delete', old.id, old.title, old.summary);"
+                " END;"
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);"
+            )
+            self.rows = self._db.execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+            row = self._db.execute("SELECT value FROM meta WHERE key = 'compacted_at'").fetchone()
+            self._compacted_at = float(row[0]) if row else 0.0
+        return self._db
+
+    def add(self, feed: str, articles: list[Article]) -> None:
+        """記事を保存する（commit() まで書き込みは保留）"""
+        now = datetime.now(timezone.utc).timestamp()
+        self._pending.extend(
+            (feed, a.id, a.title, a.link, a.summary, a.author, a.published, now) for a in articles
+        )
+
+    def commit(self) -> None:
+        """保留中の記事をまとめて書き込む（既に保存済みの記事は無視する）"""
+        if self._pending:
+            with self.db:
+                cursor = self.db.executemany(
+                    "INSERT OR IGNORE INTO articles"
+                    " (feed, aid, title, link, summary, author, published, fetched)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    self._pending,
+                )
+            self.rows += max(cursor.rowcount, 0)
+            self._pending.clear()
+        self.db   # 前回 compact() した時刻を読み込む
+        if self.retention and datetime.now(timezone.utc).timestamp() - self._compacted_at >= self.COMPACT_INTERVAL:
+            self.compact()
+
+    def compact(self) -> int:
+        """保持期間を過ぎた記事を削除し、索引とファイルを詰める。削除件数を返す"""
+        self._compacted_at = datetime.now(timezone.utc).timestamp()
+        cutoff = self._compacted_at - self.retention
+        with self.db:
+            removed = self.db.execute("DELETE FROM articles WHERE fetched < ?", (cutoff,)).rowcount
+            self.db.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('compacted_at', ?)", (str(self._compacted_at),)
+            )
+            if removed:
+                self.db.execute("INSERT INTO articles_fts (articles_fts) VALUES ('optimize')")
+        if removed:
+            # 空きページを返してから WAL を本体に書き戻し、ファイルを実際に縮める
+            # (incremental_vacuum は1ステップで1ページしか返さないため executescript で最後まで回す)
+            self.db.executescript("PRAGMA incremental_vacuum;")
+            self.db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.rows -= removed
+            print(f"[INFO] 記事アーカイブから {removed} 件を削除しました（{self.retention // 86400} 日経過）")
+        return removed
+
+    def recent(self, since: float) -> list[tuple[str, str, str, str, float]]:
+        """since 以降に取得した記事の (フィード名, 記事ID, タイトル, リンク, 取得時刻) を古い順に返す"""
+        return self.db.execute(
+            "SELECT feed, aid, title, link, fetched FROM articles WHERE fetched >= ? ORDER BY fetched",
+            (since,),
+        ).fetchall()
+
+    def search(
+        self,
+        query: str,
+        feeds: list[str] | None = None,
+        since: float | None = None,
+        limit: int = 5,
+        offset: int = 0,
+    ) -> list[tuple]:
+        """語をすべて含む記事を新しい順に返す。(feed, title, link, published) のリスト"""
+        terms = query.split()
+        long_terms = [t for t in terms if len(t) >= 3]
+        where, params = [], []
+        if long_terms:
+            # 各語をフレーズとして引用し、FTS5 の演算子として解釈させない
+            where.append("articles_fts MATCH ?")
+            params.append(" ".join('"' + t.replace('"', '""') + '"' for t in long_terms))
+        for term in terms:
+            if len(term) < 3:
+                where.append("(a.title LIKE ? ESCAPE '\\' OR a.summary LIKE ? ESCAPE '\\')")
+                params += [_like_pattern(term)] * 2
+        if feeds:
+            where.append(f"a.feed IN ({', '.join('?' * len(feeds))})")
+            params += feeds
+        if since is not None:
+            where.append("a.fetched >= ?")
+            params.append(since)
+        if long_terms:
+            # 索引側の rowid 順に辿らせると、一致件数が多くても先頭のページだけで打ち切れる
+            source, order = "articles_fts JOIN articles a ON a.id = articles_fts.rowid", "articles_fts.rowid"
+        else:
+            source, order = "articles a", "a.id"
+        sql = (
+            f"SELECT a.feed, a.title, a.link, a.published FROM {source}"
+            f" WHERE {' AND '.join(where) or '1'} ORDER BY {order} DESC LIMIT ? OFFSET ?"
+        )
+        return self.db.execute(sql, (*params, limit, offset)).fetchall()
+
+
+archive = ArticleArchive(ARCHIVE_DB_FILE, ARCHIVE_RETENTION_DAYS)
+metrics.register(CallbackMetric(
+    "newsbot_archive_articles", "記事アーカイブの保存件数", (), lambda: {(): archive.rows},
+))
+
+
+# ── ブックマーク数ランキング ──────────────────────────────
+RANKING_WINDOWS = {"daily": 86400, "weekly": 7 * 86400, "monthly": 30 * 86400}
+
+
+class BookmarkRanking:
+    """記事ごとのはてなブックマーク数の推移を記録し、期間別の上位記事を逐次更新する。
+
+    ブックマーク数は増えたときだけ標本として SQLite に書く。メモリ上には最長の期間内の記事の
+    最大値だけを持ち、(期間, フィード) ごとの上位 TOP_K を更新のたびに差し替える。
+    上位から期間外の記事が出たときだけ全件から選び直すので、ranking() は通信も全件走査も行わない。
+    記事が期間に入るかは初出時刻（フィードの日付、なければ最初に観測した時刻）で決める。
+    """
+
+    TOP_K = 10
+    COMPACT_INTERVAL = 24 * 3600
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.horizon = max(RANKING_WINDOWS.values())
+        self._db: sqlite3.Connection | None = None
+        # (feed, aid) → [最大ブックマーク数, 初出時刻, タイトル, リンク]
+        self._items: dict[tuple[str, str], list] = {}
+        self._tops: dict[tuple[str, str], list[tuple[str, str]]] = {}
+        self._samples: list[tuple] = []
+        self._dirty: set[tuple[str, str]] = set()
+        self._compacted_at = 0.0   # 前回 _compact() した UNIX 時刻（DB を開いた時に読み込む）
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = sqlite3.connect(self.path)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(
+                "CREATE TABLE IF NOT EXISTS samples ("
+                " feed TEXT NOT NULL, aid TEXT NOT NULL, ts REAL NOT NULL, count INTEGER NOT NULL,"
+                " PRIMARY KEY (feed, aid, ts)) WITHOUT ROWID;"
+                "CREATE TABLE IF NOT EXISTS items ("
+                " feed TEXT NOT NULL, aid TEXT NOT NULL, title TEXT NOT NULL, link TEXT NOT NULL,"
+                " first_seen REAL NOT NULL, peak INTEGER NOT NULL,"
+                " PRIMARY KEY (feed, aid)) WITHOUT ROWID;"
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);"
+            )
+            row = self._db.execute("SELECT value FROM meta WHERE key = 'compacted_at'").fetchone()
+            self._compacted_at = float(row[0]) if row else 0.0
+            cutoff = datetime.now(timezone.utc).timestamp() - self.horizon
+            for feed, aid, title, link, first_seen, peak in self._db.execute(
+                "SELECT feed, aid, title, link, first_seen, peak FROM items WHERE first_seen >= ?", (cutoff,)
+            ):
+                self._items[(feed, aid)] = [peak, first_seen, title, link]
+        return self._db
+
+    def observe(self, feed: str, articles: list[Article]) -> None:
+        """取得した記事のブックマーク数を取り込む（commit() まで書き込みは保留）"""
+        self.db
+        now = datetime.now(timezone.utc).timestamp()
+        for article in articles:
+            if article.bookmarks is None:
+                continue
+            key = (feed, article.id)
+            item = self._items.get(key)
+            if item is None:
+                first_seen = min(article.published or now, now)
+                if first_seen < now - self.horizon:
+                    continue
+                item = self._items[key] = [0, first_seen, article.title, article.link]
+            if article.bookmarks <= item[0]:
+                continue
+            item[0] = article.bookmarks
+            self._samples.append((feed, article.id, now, article.bookmarks))
+            self._dirty.add(key)
+            self._promote(key, item, now)
+
+    def _promote(self, key: tuple[str, str], item: list, now: float) -> None:
+        """数の増えた記事を、その記事が入る期間の上位に反映する"""
+        feed = key[0]
+        for window, seconds in RANKING_WINDOWS.items():
+            top = self._tops.get((window, feed))
+            if top is None or item[1] < now - seconds:
+                continue   # 未集計の期間は ranking() で初めて選ぶ
+            if key not in top:
+                if len(top) >= self.TOP_K and item[0] <= self._items[top[-1]][0]:
+                    continue
+                top.append(key)
+            top.sort(key=lambda k: self._items[k][0], reverse=True)
+            del top[self.TOP_K:]
+
+    def ranking(self, window: str, feed: str, k: int = 5) -> list[tuple[str, str, int, float]]:
+        """期間内に初出の記事をブックマーク数の多い順に返す。(タイトル, リンク, 件数, 初出時刻) のリスト"""
+        self.db
+        cutoff = datetime.now(timezone.utc).timestamp() - RANKING_WINDOWS[window]
+        top = self._tops.get((window, feed))
+        if top is None or any(self._items[key][1] < cutoff for key in top):
+            candidates = (
+                key for key, item in self._items.items() if key[0] == feed and item[1] >= cutoff
+            )
+            top = self._tops[(window, feed)] = heapq.nlargest(
+                self.TOP_K, candidates, key=lambda key: self._items[key][0]
+            )
+        return [tuple(self._items[key][2:4]) + (self._items[key][0], self._items[key][1]) for key in top[:k]]
+
+    def feeds(self) -> set[str]:
+        """ブックマーク数を記録しているフィード名"""
+        self.db
+        return {feed for feed, _ in self._items}
+
+    def commit(self) -> None:
+        """保留中の標本と記事の最大値をまとめて書き込み、1日1回古い記録を捨てる"""
+        if self._samples:
+            with self.db:
+                self.db.executemany("INSERT OR IGNORE INTO samples VALUES (?, ?, ?, ?)", self._samples)
+                self.db.executemany(
+                    "INSERT INTO items (feed, aid, title, link, first_seen, peak) VALUES (?, ?, ?, ?, ?, ?)"
+                    " ON CONFLICT (feed, aid) DO UPDATE SET peak = excluded.peak",
+                    [(feed, aid, *self._items[(feed, aid)][2:4], self._items[(feed, aid)][1], self._items[(feed, aid)][0])
+                     for feed, aid in self._dirty],
+                )
+            self._samples.clear()
+            self._dirty.clear()
+        self.db   # 前回 _compact() した時刻を読み込む
+        if datetime.now(timezone.utc).timestamp() - self._compacted_at >= self.COMPACT_INTERVAL:
+            self._compact()
+
+    def _compact(self) -> None:
+        self._compacted_at = datetime.now(timezone.utc).timestamp()
+        cutoff = self._compacted_at - self.horizon
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('compacted_at', ?)", (str(self._compacted_at),)
+            )
+            self.db.execute(
+                "DELETE FROM samples WHERE (feed, aid) IN (SELECT feed, aid FROM items WHERE first_seen < ?)",
+                (cutoff,),
+            )
+            self.db.execute("DELETE FROM items WHERE first_seen < ?", (cutoff,))
+        for key in [key for key, item in self._items.items() if item[1] < cutoff]:
+            del self._items[key]
+        # 期間外の記事が上位に残っていれば次の ranking() で選び直す
+        self._tops = {
+            top_key: top for top_key, top in self._tops.items() if all(key in self._items for key in top)
+        }
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+bookmark_ranking = BookmarkRanking(BOOKMARKS_DB_FILE)
+metrics.register(CallbackMetric(
+    "newsbot_bookmark_tracked_articles", "ブックマーク数を追跡している記事数", (), lambda: {(): len(bookmark_ranking)},
+))
+
+
+# ── 共有HTTPセッション ────────────────────────────────────
+# brotli が導入されていれば aiohttp が br 応答を展開できるので要求に含める
+_HAS_BROTLI = any(importlib.util.find_spec(m) for m in ("brotli", "brotlicffi"))
+ACCEPT_ENCODING = "gzip, deflate, br" if _HAS_BROTLI else "gzip, deflate"
+
+_http_session: aiohttp.ClientSession | None = None
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Bot の生存期間を通して共有する ClientSession を返す（未作成なら作成する）"""
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_LIMIT,
+            limit_per_host=FETCH_PER_HOST,
+            ttl_dns_cache=HTTP_DNS_TTL_SECONDS,
+            keepalive_timeout=HTTP_KEEPALIVE_SECONDS,
+        )
+        _http_session = aiohttp.ClientSession(
+            connector=connector,
+            headers={"Accept-Encoding": ACCEPT_ENCODING},
+        )
+    return _http_session
+
+
+async def close_http_session() -> None:
+    """共有 ClientSession を閉じる"""
+    global _http_session
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
+
+
+# ── 条件付きGETキャッシュ ────────────────────────────────
+class FeedCache:
+    """URLごとの検証子 (ETag / Last-Modified) と最終パース結果を保持する。
+
+    検証子と本文は URL ごとのファイルに永続化し（更新時はそのURLの分だけ書き直す）、
+    メモリ上には検証子と記事レコードだけを持つ。再起動直後に 304 が返った場合は、
+    呼び出し側が保存済みの本文をファイルから読んで一度だけパースし直す。
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self._records: dict[str, dict | None] = {}
+        self._parsed: dict[str, ParsedFeed] = {}
+
+    def _path(self, url: str) -> Path:
+        return self.directory / f"{hashlib.sha256(url.encode()).hexdigest()[:24]}.json"
+
+    def _load(self, url: str) -> dict | None:
+        try:
+            return json.loads(self._path(url).read_text(encoding="utf-8"))
+        except (json.JSONDecodeError, OSError):
+            return None
+
+    def _record(self, url: str) -> dict | None:
+        """検証子を返す（本文はメモリに載せず、有無だけを持つ）"""
+        if url not in self._records:
+            record = self._load(url)
+            if record is not None:
+                record["has_body"] = record.pop("body", None) is not None
+            self._records[url] = record
+        return self._records[url]
+
+    def request_headers(self, url: str, partial_ok: bool = False) -> dict[str, str]:
+        """条件付きGET用のリクエストヘッダーを返す。
+
+        304 が返っても再利用できる結果がない場合（途中で打ち切った結果しかなく、
+        呼び出し側が全件を必要とする場合など）は検証子を送らない。
+        """
+        record = self._record(url)
+        headers: dict[str, str] = {}
+        if record and self._reusable(url, partial_ok):
+            if record.get("etag"):
+                headers["If-None-Match"] = record["etag"]
+            if record.get("last_modified"):
+                headers["If-Modified-Since"] = record["last_modified"]
+        return headers
+
+    def _reusable(self, url: str, partial_ok: bool) -> bool:
+        parsed = self._parsed.get(url)
+        if parsed is not None:
+            return partial_ok or not parsed.get("partial")
+        record = self._record(url)
+        return bool(record and record["has_body"])
+
+    def get(self, url: str, partial_ok: bool = False) -> ParsedFeed | None:
+        """304 応答時に返す前回のパース結果を取得する"""
+        parsed = self._parsed.get(url)
+        if parsed is not None and (partial_ok or not parsed.get("partial")):
+            return parsed
+        return None
+
+    def body(self, url: str) -> str | None:
+        """保存済みのレスポンス本文を返す（再起動直後の再パース用）"""
+        record = self._record(url)
+        if not (record and record["has_body"]):
+            return None
+        record = self._load(url)
+        return record.get("body") if record else None
+
+    def remember(self, url: str, feed: ParsedFeed) -> None:
+        """保存済み本文をパースし直した結果をメモリに載せる"""
+        self._parsed[url] = feed
+
+    def store(self, url: str, headers, body: str | None, feed: ParsedFeed) -> None:
+        """200 応答の検証子・本文・パース結果を保存する（途中で打ち切った場合 body は None）"""
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+        if not etag and not last_modified:
+            # 検証子のないフィードはキャッシュしない
+            self.forget(url)
+            return
+        self._records[url] = {"etag": etag, "last_modified": last_modified, "has_body": body is not None}
+        self._parsed[url] = feed
+        # 書き込み途中で落ちても壊れないよう一時ファイル経由で置き換える
+        record = {"etag": etag, "last_modified": last_modified, "body": body}
+        path = self._path(url)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(record, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+
+    def forget(self, url: str) -> None:
+        """URLのキャッシュを破棄する"""
+        self._parsed.pop(url, None)
+        if self._records.pop(url, None) is not None:
+            self._path(url).unlink(missing_ok=True)
+
+
+feed_cache = FeedCache(HTTP_CACHE_DIR)
+metrics.register(CallbackMetric(
+    "newsbot_http_cache_requests_total", "条件付きGETキャッシュのヒット/ミス数", ("result",),
+    lambda: {("hit",): feed_cache.hits, ("miss",): feed_cache.misses},
+    kind="counter",
+))
+
+
+# ── フィードのパース ──────────────────────────────────────
+_parse_executor: Executor | None = None
+_parse_slots = asyncio.Semaphore(PARSE_QUEUE_SIZE)
+# URLごとの直近のパース所要時間 (ミリ秒)
+parse_times: dict[str, float] = {}
+
+
+def _get_parse_executor() -> Executor:
+    global _parse_executor
+    if _parse_executor is None:
+        if PARSE_EXECUTOR == "process":
+            from concurrent.futures import ProcessPoolExecutor
+
+            _parse_executor = ProcessPoolExecutor(max_workers=PARSE_WORKERS)
+        else:
+            _parse_executor = ThreadPoolExecutor(max_workers=PARSE_WORKERS, thread_name_prefix="feedparse")
+    return _parse_executor
+
+
+def shutdown_parse_executor() -> None:
+    global _parse_executor
+    if _parse_executor is not None:
+        _parse_executor.shutdown(wait=False, cancel_futures=True)
+        _parse_executor = None
+
+
+def parse_articles(text: str) -> list[Article]:
+    """フィード本文をパースして記事レコードの一覧にする（パース結果の辞書はここで手放す）"""
+    import feedparser   # 読み込みに時間がかかるので、初めてフォールバックのパースが必要になった時に読む
+
+    return [Article.from_entry(entry) for entry in feedparser.parse(text).entries]
+
+
+def _parse_articles_timed(text: str) -> tuple[list[Article], float]:
+    """parse_articles() の結果と、それに使った CPU 時間（秒）を返す（ワーカーの中で計測する）"""
+    start = thread_time()
+    articles = parse_articles(text)
+    return articles, thread_time() - start
+
+
+async def parse_feed(url: str, text: str) -> ParsedFeed:
+    """フィード本文をパースし、entries に記事レコードを持つ結果を返す。
+
+    大きな本文はワーカープールで処理しイベントループを塞がない。
+    """
+    start = perf_counter()
+    if len(text) < PARSE_INLINE_SIZE:
+        articles, cpu = _parse_articles_timed(text)
+    else:
+        async with _parse_slots:
+            loop = asyncio.get_running_loop()
+            articles, cpu = await loop.run_in_executor(_get_parse_executor(), _parse_articles_timed, text)
+    elapsed = perf_counter() - start
+    parse_times[url] = elapsed * 1000
+    STAGE_SECONDS.observe(elapsed, "parse", feed_label(url))
+    PARSE_CPU.inc(feed_label(url), amount=cpu)
+    return ParsedFeed(entries=articles)
+
+
+# ── ストリーミングパース ──────────────────────────────────
+STREAM_CHUNK_SIZE = 16 * 1024
+_RDF_ABOUT = "{http://www.w3.org/1999/02/22-rdf-syntax-ns#}about"
+
+
+def _local(tag: str) -> str:
+    """名前空間を除いた要素名を返す"""
+    return tag.rsplit("}", 1)[-1]
+
+
+def _element_to_entry(item: ET.Element) -> dict:
+    """RSS 1.0 / 2.0 の item、Atom の entry 要素を feedparser 互換のエントリに変換する。
+
+    Bot が参照するフィールドだけを、feedparser と同じキー・同じ値になるよう取り出す。
+    """
+    entry: dict = {}
+    tags: list[dict] = []
+    links: list[dict] = []
+    thumbnails: list[dict] = []
+    about = item.get(_RDF_ABOUT)
+    if about:
+        entry["id"] = about
+    for child in item:
+        name = _local(child.tag)
+        text = (child.text or "").strip()
+        if name == "title":
+            entry["title"] = text
+        elif name == "link":
+            href = child.get("href")
+            if href is None:
+                entry["link"] = text
+            elif child.get("rel", "alternate") == "alternate":
+                entry.setdefault("link", href)
+            elif child.get("rel") == "enclosure":
+                links.append({"rel": "enclosure", "href": href, "type": child.get("type", "")})
+        elif name in ("guid", "id"):
+            entry["id"] = text
+            if name == "guid" and child.get("isPermaLink", "true") != "false":
+                entry.setdefault("link", text)
+        elif name in ("description", "summary"):
+            entry["summary"] = child.text or ""
+        elif name in ("content", "encoded"):
+            # 概要がないエントリは feedparser と同じく本文を概要に使う（明示的な概要が優先）
+            entry.setdefault(
+                "summary", (child.text or "") if len(child) == 0 else "".join(child.itertext()))
+        elif name == "pubDate":
+            try:
+                entry["published_parsed"] = parsedate_to_datetime(text).utctimetuple()
+            except (TypeError, ValueError):
+                pass
+        elif name in ("published", "updated", "date"):
+            try:
+                parsed = datetime.fromisoformat(text.replace("Z", "+00:00")).utctimetuple()
+            except ValueError:
+                continue
+            key = "published_parsed" if name == "published" else "updated_parsed"
+            entry[key] = parsed
+        elif name in ("creator", "author"):
+            # Atom の author は name 子要素に名前を持つ
+            author_name = next((c.text for c in child if _local(c.tag) == "name"), None)
+            entry["author"] = (author_name or text).strip()
+        elif name in ("category", "subject"):
+            term = child.get("term", text)
+            if term:
+                tags.append({"term": term})
+        elif name == "enclosure":
+            links.append({"rel": "enclosure", "href": child.get("url", ""), "type": child.get("type", "")})
+        elif name == "thumbnail":
+            thumbnails.append({"url": child.get("url", "")})
+        elif name == "bookmarkcount":
+            entry["hatena_bookmarkcount"] = text
+    if "published_parsed" in entry:
+        entry.setdefault("updated_parsed", entry["published_parsed"])
+    if tags:
+        entry["tags"] = tags
+    entry["links"] = links
+    # feedparser と同じく enclosures は links のうち rel="enclosure" のもの
+    entry["enclosures"] = [link for link in links if link["rel"] == "enclosure"]
+    if thumbnails:
+        entry["media_thumbnail"] = thumbnails
+    return entry
+
+
+async def _stream_entries(
+    resp: aiohttp.ClientResponse, is_known: Callable[[Article], bool]
+) -> tuple[ParsedFeed | None, bytes, float]:
+    """レスポンス本文を逐次パースし、既読記事が連続したところで読み込みを打ち切る。
+
+    (パース結果, 読み込んだ本文, パースに使った CPU 時間) を返す。XMLとして読めない文書の場合は本文を最後まで読み、
+    パース結果に None を返す（呼び出し側で feedparser にフォールバックする）。
+    """
+    parser = ET.XMLPullParser(events=("end",))
+    raw = bytearray()
+    entries = []
+    known_run = 0
+    truncated = False
+    cpu = 0.0
+    try:
+        async for chunk in resp.content.iter_chunked(STREAM_CHUNK_SIZE):
+            raw += chunk
+            start = thread_time()
+            parser.feed(chunk)
+            for _, elem in parser.read_events():
+                if _local(elem.tag) not in ("item", "entry"):
+                    continue
+                entry = Article.from_entry(_element_to_entry(elem))
+                elem.clear()
+                entries.append(entry)
+                known_run = known_run + 1 if is_known(entry) else 0
+                if known_run >= STREAM_STOP_AFTER_KNOWN:
+                    truncated = True
+                    break
+            cpu += thread_time() - start
+            if truncated:
+                break
+        else:
+            parser.close()
+    except ET.ParseError:
+        raw += await resp.content.read()
+        return None, bytes(raw), cpu
+    return ParsedFeed(entries=entries, partial=truncated), bytes(raw), cpu
+
+
+# ── サーキットブレーカー ──────────────────────────────────
+class CircuitBreaker:
+    """ホスト単位のサーキットブレーカー。
+
+    連続失敗が BREAKER_THRESHOLD 回に達すると open になり、クールダウンが明けるまで
+    そのホストへのリクエストを行わない。明けたら1件だけ試し (half-open)、成功すれば閉じる。
+    """
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.trial = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self.trial or monotonic() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self.trial:
+            self.trial = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.trial or self.failures >= self.threshold:
+            self.opened_at = monotonic()
+        self.trial = False
+
+    def abandon_trial(self) -> None:
+        """試行が成否不明のまま終わった（キャンセルされた）場合に、次の試行を許可する"""
+        self.trial = False
+
+    def remaining(self) -> float:
+        """open 状態が明けるまでの秒数"""
+        if self.opened_at is None:
+            return 0.0
+        return max(self.cooldown - (monotonic() - self.opened_at), 0.0)
+
+
+breakers: dict[str, CircuitBreaker] = {}
+
+
+_BREAKER_STATES = {"closed": 0, "half-open": 1, "open": 2}
+metrics.register(CallbackMetric(
+    "newsbot_circuit_breaker_state", "ホストごとのブレーカー状態 (0=closed, 1=half-open, 2=open)", ("host",),
+    lambda: {(host,): _BREAKER_STATES[b.state] for host, b in breakers.items()},
+))
+
+
+def get_breaker(url: str) -> CircuitBreaker:
+    host = urlparse(url).hostname or ""
+    if host not in breakers:
+        breakers[host] = CircuitBreaker(BREAKER_THRESHOLD, BREAKER_COOLDOWN_SECONDS)
+    return breakers[host]
+
+
+def _is_transient(error: Exception) -> bool:
+    """再試行すれば回復しうるエラーか"""
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status >= 500 or error.status == 429
+    return isinstance(error, (asyncio.TimeoutError, aiohttp.ClientConnectionError, aiohttp.ClientPayloadError))
+
+
+def _backoff(attempt: int) -> float:
+    """指数バックオフ（フルジッター）の待ち秒数"""
+    return random.uniform(0, min(FETCH_BACKOFF_MAX, FETCH_BACKOFF_BASE * 2 ** attempt))
+
+
 # ── フィード取得 ──────────────────────────────────────────
-async def fetch_feed(session: aiohttp.ClientSession, url: str) -> feedparser.FeedParserDict:
-    """非同期でRSSフィードを取得してパースする"""
+_XML_ENCODING = re.compile(rb"""^\s*<\?xml[^>]*encoding=["']([A-Za-z0-9._-]+)["']""")
+
+
+def _decode_body(raw: bytes, charset: str | None) -> str:
+    """本文を文字列にする。文字コードは Content-Type、XML宣言、UTF-8 の順に決める"""
+    if not charset:
+        match = _XML_ENCODING.match(raw)
+        charset = match.group(1).decode("ascii") if match else "utf-8"
     try:
-        async with session.get(url, timeout=aiohttp.ClientTimeout(total=30)) as resp:
-            text = await resp.text()
-            return feedparser.parse(text)
-    except Exception as e:
-        print(f"[ERROR] フィード取得失敗: {url} - {e}")
-        return feedparser.FeedParserDict()
+        return raw.decode(charset, errors="replace")
+    except LookupError:
+        return raw.decode("utf-8", errors="replace")
+
+
+FETCH_TIMEOUT = aiohttp.ClientTimeout(total=FETCH_TOTAL_TIMEOUT, sock_connect=FETCH_CONNECT_TIMEOUT, sock_read=FETCH_READ_TIMEOUT)
+
+
+async def fetch_feed(
+    session: aiohttp.ClientSession,
+    url: str,
+    is_known: Callable[[Article], bool] | None = None,
+) -> ParsedFeed:
+    """非同期でRSSフィードを取得してパースする（304 の場合は前回の結果を返す）
+
+    is_known を渡すと本文をストリーミングでパースし、既読エントリが
+    STREAM_STOP_AFTER_KNOWN 件続いた時点で残りの読み込みとパースを省略する。
+    その場合の結果は新しい側の一部のエントリだけになる (feed["partial"] が True)。
+
+    一時的なエラーは FETCH_RETRIES 回まで指数バックオフで再試行する。失敗が続くホストは
+    サーキットブレーカーで一定時間スキップする。失敗時は空の ParsedFeed を返す。
+    """
+    breaker = get_breaker(url)
+    if not breaker.allow():
+        print(f"[WARN] ホスト遮断中のためスキップ: {url} (残り {breaker.remaining():.0f} 秒)")
+        return ParsedFeed()
+    trial = breaker.trial
+    try:
+        for attempt in range(FETCH_RETRIES + 1):
+            try:
+                feed = await _fetch_once(session, url, is_known)
+            except Exception as e:
+                if _is_transient(e) and attempt < FETCH_RETRIES:
+                    await asyncio.sleep(_backoff(attempt))
+                    continue
+                breaker.record_failure()
+                FEED_ERRORS.inc(feed_label(url))
+                print(f"[ERROR] フィード取得失敗: {url} - {type(e).__name__}: {e}")
+                return ParsedFeed()
+            breaker.record_success()
+            return feed
+        return ParsedFeed()
+    finally:
+        # キャンセルされた試行で half-open のまま固まらないようにする（成否を記録済みなら何もしない）
+        if trial:
+            breaker.abandon_trial()
+
+
+async def _fetch_once(
+    session: aiohttp.ClientSession,
+    url: str,
+    is_known: Callable[[Article], bool] | None,
+) -> ParsedFeed:
+    """1回分のリクエストを行う。HTTPエラーや通信エラーは例外として送出する"""
+    streaming = STREAM_PARSE and is_known is not None
+    headers = feed_cache.request_headers(url, partial_ok=streaming)
+    async with session.get(url, headers=headers, timeout=FETCH_TIMEOUT) as resp:
+        if resp.status == 304:
+            cached = feed_cache.get(url, partial_ok=streaming)
+            if cached is None and (body := feed_cache.body(url)) is not None:
+                cached = await parse_feed(url, body)
+                feed_cache.remember(url, cached)
+            if cached is not None:
+                feed_cache.hits += 1
+                return cached
+            # キャッシュ本文が失われている場合は検証子を捨てて取り直す
+            feed_cache.forget(url)
+            return await _fetch_once(session, url, is_known)
+        resp.raise_for_status()
+        feed_cache.misses += 1
+        if streaming:
+            start = perf_counter()
+            feed, raw, cpu = await _stream_entries(resp, is_known)
+            text = _decode_body(raw, resp.charset)
+            FEED_BYTES.inc(feed_label(url), amount=len(raw))
+            PARSE_CPU.inc(feed_label(url), amount=cpu)
+            if feed is None:
+                feed = await parse_feed(url, text)
+            else:
+                elapsed = perf_counter() - start
+                parse_times[url] = elapsed * 1000
+                STAGE_SECONDS.observe(elapsed, "parse", feed_label(url))
+            feed_cache.store(url, resp.headers, None if feed.get("partial") else text, feed)
+            return feed
+        raw = await resp.read()
+        FEED_BYTES.inc(feed_label(url), amount=len(raw))
+        text = _decode_body(raw, resp.charset)
+        feed = await parse_feed(url, text)
+        feed_cache.store(url, resp.headers, text, feed)
+        return feed
+
+
+async def fetch_feeds(
+    session: aiohttp.ClientSession,
+    feeds: list[dict],
+    is_known: Callable[[dict, Article], bool] | None = None,
+):
+    """複数フィードを並列取得し、feeds の順に (feed_meta, feed) を返す非同期ジェネレータ（パイプラインの取得段）。
+
+    取得は並列に進めるが（全体・ホスト単位の同時接続数を制限）、返す順は feeds の順に揃えるので投稿順は毎回同じになる。
+    先に終わったフィードは前のフィードを返すまで待たせる。先行して取得できるのは
+    FETCH_CONCURRENCY + PIPELINE_QUEUE_SIZE 件までで、下流が追いつかないと新たな取得も止まる。
+    is_known(feed_meta, entry) を渡すと既読に達した時点で各フィードの読み込みを打ち切る。
+    取得した記事は記事アーカイブとブックマーク数の記録にも取り込む。
+    """
+    global_sem = asyncio.Semaphore(FETCH_CONCURRENCY)
+    host_sems: dict[str, asyncio.Semaphore] = {}
+    # 取得を始めてからまだ下流へ渡していないフィード数の上限（待機は FIFO なので feeds の順に枠を得る）
+    ahead = asyncio.Semaphore(FETCH_CONCURRENCY + PIPELINE_QUEUE_SIZE)
+
+    async def _fetch(feed_meta: dict) -> ParsedFeed:
+        await ahead.acquire()
+        host = urlparse(feed_meta["url"]).hostname or ""
+        host_sem = host_sems.setdefault(host, asyncio.Semaphore(FETCH_PER_HOST))
+        def known(entry: Article) -> bool:
+            return is_known(feed_meta, entry)
+
+        _feed_names[feed_meta["url"]] = feed_meta["name"]
+        async with host_sem, global_sem:
+            try:
+                with stage_timer("fetch", feed_meta["name"]):
+                    # ランキング集計用のフィードは投稿済みの記事のブックマーク数も追うため、全件をパースする
+                    streaming = is_known is not None and not feed_meta.get("ranking")
+                    return await fetch_feed(session, feed_meta["url"], known if streaming else None)
+            except Exception as e:
+                print(f"[ERROR] {feed_meta['name']}: {type(e).__name__}: {e}")
+                return ParsedFeed()
+
+    tasks = [asyncio.create_task(_fetch(feed_meta)) for feed_meta in feeds]
+    try:
+        for feed_meta, task in zip(feeds, tasks):
+            feed = await task
+            ahead.release()
+            # 新しく取得した記事をアーカイブに積む（304 で使い回した結果は保存済み）
+            if feed.get("entries") and not feed.get("archived"):
+                archive.add(feed_meta["name"], feed.entries)
+                bookmark_ranking.observe(feed_meta["name"], feed.entries)
+                feed["archived"] = True
+            yield feed_meta, feed
+    finally:
+        # 途中で打ち切られた場合は残りの取得をキャンセル
+        for task in tasks:
+            task.cancel()
+        # 1回の巡回で取得した記事はまとめて1トランザクションで書き込む
+        archive.commit()
+        bookmark_ranking.commit()
 
 
 # ── Embed作成 ─────────────────────────────────────────────
 JST = timezone(timedelta(hours=9))
 
+# Discord の Embed 上限
+EMBED_TITLE_LIMIT = 256
+EMBED_AUTHOR_LIMIT = 256
+EMBEDS_PER_MESSAGE = 10
+EMBED_CHARS_PER_MESSAGE = 6000
+
 
-def make_embed(entry: dict, feed_meta: dict) -> discord.Embed:
-    """フィードエントリからDiscord Embedを作成する"""
-    title = entry.get("title", "タイトルなし")
-    link = entry.get("link", "")
-    summary = entry.get("summary", entry.get("description", ""))
+def _truncate(text: str, limit: int) -> str:
+    return text if len(text) <= limit else text[: limit - 1] + "…"
 
-    # HTMLタグを簡易除去
-    import re
-    summary = re.sub(r"<[^>]+>", "", summary)
-    if len(summary) > 200:
-        summary = summary[:200] + "…"
 
+def make_embed(entry: Article, feed_meta: dict) -> discord.Embed:
+    """記事レコードからDiscord Embedを作成する"""
     embed = discord.Embed(
-        title=title,
-        url=link,
-        description=summary if summary else None,
+        title=_truncate(entry.title or "タイトルなし", EMBED_TITLE_LIMIT),
+        url=entry.link,
+        description=entry.summary or None,
         color=feed_meta["color"],
     )
 
     # 公開日時
-    published = entry.get("published_parsed") or entry.get("updated_parsed")
-    if published:
-        try:
-            dt = datetime(*published[:6], tzinfo=timezone.utc)
-            embed.timestamp = dt
-        except Exception:
-            pass
+    if entry.published is not None:
+        embed.timestamp = datetime.fromtimestamp(entry.published, timezone.utc)
 
     # 著者
-    author = entry.get("author")
-    if author:
-        embed.set_author(name=author)
+    if entry.author:
+        embed.set_author(name=_truncate(entry.author, EMBED_AUTHOR_LIMIT))
 
     # フッター: フィード名
     embed.set_footer(text=feed_meta["name"])
 
-    # サムネイル (はてブにはenclosureが含まれることがある)
-    if "media_thumbnail" in entry and entry["media_thumbnail"]:
-        embed.set_thumbnail(url=entry["media_thumbnail"][0].get("url", ""))
-    elif "enclosures" in entry and entry["enclosures"]:
-        enc = entry["enclosures"][0]
-        if enc.get("type", "").startswith("image"):
-            embed.set_thumbnail(url=enc.get("href", ""))
+    # サムネイル
+    if entry.thumbnail:
+        embed.set_thumbnail(url=entry.thumbnail)
 
     return embed
 
 
+def pack_embeds(embeds: list[discord.Embed]) -> list[list[discord.Embed]]:
+    """Embed を順序を保ったまま、1メッセージの上限（10件・合計6000文字）内で詰め合わせる"""
+    batches: list[list[discord.Embed]] = []
+    batch: list[discord.Embed] = []
+    chars = 0
+    for embed in embeds:
+        size = len(embed)
+        if batch and (len(batch) >= EMBEDS_PER_MESSAGE or chars + size > EMBED_CHARS_PER_MESSAGE):
+            batches.append(batch)
+            batch, chars = [], 0
+        batch.append(embed)
+        chars += size
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+# ── 送信ディスパッチャ ────────────────────────────────────
+PRIORITY_COMMAND = 0   # コマンドへの応答
+PRIORITY_BULK = 1      # 記事の一括投稿
+
+_MESSAGES_ROUTE = re.compile(r"/channels/(\d+)/messages$")
+
+
+class TokenBucket:
+    """チャンネル単位のトークンバケット。Discord の X-RateLimit-* ヘッダーで残量を補正する"""
+
+    def __init__(self, capacity: int, per_second: float):
+        self.capacity = capacity
+        self.per_second = per_second
+        self.tokens = float(capacity)
+        self.updated = monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.per_second)
+        self.updated = now
+
+    async def acquire(self) -> None:
+        while True:
+            now = monotonic()
+            if now < self.blocked_until:
+                await asyncio.sleep(self.blocked_until - now)
+                continue
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.per_second)
+
+    def update(self, limit: int, remaining: int, reset_after: float) -> None:
+        """レスポンスヘッダーの値でバケットを同期する"""
+        now = monotonic()
+        self.capacity = limit
+        self.tokens = float(remaining)
+        self.updated = now
+        if remaining == 0:
+            self.blocked_until = now + reset_after
+
+
+class Dispatcher:
+    """Discord への送信を一元管理するチャンネルごとの優先度付きキュー。
+
+    チャンネルごとにワーカーが1つあり、投入順（同一優先度内）に1件ずつ送信する。
+    送信間隔は固定 sleep ではなくトークンバケットで制御する。
+    """
+
+    def __init__(self):
+        self._queues: dict[int, asyncio.PriorityQueue] = {}
+        self._workers: dict[int, asyncio.Task] = {}
+        self._buckets: dict[int, TokenBucket] = {}
+        self._seq = itertools.count()
+        self.sent = 0
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _bucket(self, channel_id: int) -> TokenBucket:
+        if channel_id not in self._buckets:
+            self._buckets[channel_id] = TokenBucket(SEND_BURST, SEND_PER_SECOND)
+        return self._buckets[channel_id]
+
+    def submit(self, channel, *args, priority: int = PRIORITY_BULK, **kwargs) -> asyncio.Future:
+        """channel.send(*args, **kwargs) をキューに積み、送信結果の Future を返す"""
+        channel_id = getattr(channel, "id", None) or id(channel)
+        queue = self._queues.get(channel_id)
+        if queue is None:
+            queue = self._queues[channel_id] = asyncio.PriorityQueue()
+            self._workers[channel_id] = asyncio.create_task(self._worker(channel_id, queue))
+        future = asyncio.get_running_loop().create_future()
+        queue.put_nowait((priority, next(self._seq), monotonic(), channel, args, kwargs, future))
+        return future
+
+    async def send(self, channel, *args, priority: int = PRIORITY_BULK, **kwargs):
+        """送信して Discord が受け付けた Message を返す"""
+        return await self.submit(channel, *args, priority=priority, **kwargs)
+
+    async def _worker(self, channel_id: int, queue: asyncio.PriorityQueue) -> None:
+        bucket = self._bucket(channel_id)
+        while True:
+            _, _, enqueued, channel, args, kwargs, future = await queue.get()
+            try:
+                if future.cancelled():
+                    continue
+                await bucket.acquire()
+                waited = monotonic() - enqueued
+                self.waits += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+                try:
+                    message = await channel.send(*args, **kwargs)
+                except Exception as e:
+                    if not future.cancelled():
+                        future.set_exception(e)
+                else:
+                    self.sent += 1
+                    if not future.cancelled():
+                        future.set_result(message)
+            finally:
+                queue.task_done()
+
+    def observe_headers(self, channel_id: int, headers) -> None:
+        """メッセージ送信レスポンスのレートリミットヘッダーを取り込む"""
+        try:
+            limit = int(headers["X-RateLimit-Limit"])
+            remaining = int(headers["X-RateLimit-Remaining"])
+            reset_after = float(headers["X-RateLimit-Reset-After"])
+        except (KeyError, ValueError):
+            return
+        self._bucket(channel_id).update(limit, remaining, reset_after)
+
+    def depth(self) -> int:
+        """送信待ちの件数"""
+        return sum(queue.qsize() for queue in self._queues.values())
+
+    async def close(self) -> None:
+        for task in self._workers.values():
+            task.cancel()
+        await asyncio.gather(*self._workers.values(), return_exceptions=True)
+        self._queues.clear()
+        self._workers.clear()
+
+
+dispatcher = Dispatcher()
+metrics.register(CallbackMetric(
+    "newsbot_send_queue_depth", "送信待ちのメッセージ数", (), lambda: {(): dispatcher.depth()},
+))
+metrics.register(CallbackMetric(
+    "newsbot_messages_sent_total", "Discord に送信したメッセージ数", (), lambda: {(): dispatcher.sent},
+    kind="counter",
+))
+metrics.register(CallbackMetric(
+    "newsbot_send_wait_seconds_total", "送信キューでの待ち時間の合計", (), lambda: {(): dispatcher.wait_total},
+    kind="counter",
+))
+
+
+async def _on_discord_request_end(session, ctx, params: aiohttp.TraceRequestEndParams) -> None:
+    """discord.py の HTTP 通信からメッセージ送信のレートリミットヘッダーを拾う"""
+    if params.method != "POST":
+        return
+    match = _MESSAGES_ROUTE.search(params.url.path)
+    if match:
+        dispatcher.observe_headers(int(match.group(1)), params.response.headers)
+
+
+discord_trace = aiohttp.TraceConfig()
+discord_trace.on_request_end.append(_on_discord_request_end)
+
+
+async def send_staged(channel, nonce: str, batch: list[discord.Embed], priority: int = PRIORITY_BULK) -> list[bool]:
+    """送信箱に記録済みのメッセージを送り、Embed ごとの送信成否を送信箱に返す（確定は seen_store.commit()）。
+
+    nonce を付けて送るので、Discord は同じ nonce の直近の再送を新しいメッセージにしない。
+    Discord に拒否された (400) 場合は、半分ずつを別の nonce のメッセージとして送信箱に記録し直してから送る
+    （途中で停止しても、送り済みの半分が再送で重複しない）。
+    """
+    try:
+        await dispatcher.send(channel, embeds=batch, priority=priority, nonce=nonce)
+        sent = [True] * len(batch)
+    except discord.HTTPException as e:
+        if e.status == 400 and len(batch) > 1:
+            half = len(batch) // 2
+            first, second = seen_store.split(nonce, half)
+            return (
+                await send_staged(channel, first, batch[:half], priority)
+                + await send_staged(channel, second, batch[half:], priority)
+            )
+        print(f"[ERROR] 送信失敗 (channel {getattr(channel, 'id', '?')}): {e}")
+        sent = [False] * len(batch)
+    except Exception as e:
+        print(f"[ERROR] 送信失敗 (channel {getattr(channel, 'id', '?')}): {type(e).__name__}: {e}")
+        sent = [False] * len(batch)
+    if not all(sent):
+        EMBEDS_FAILED.inc(str(getattr(channel, "id", "?")), amount=sent.count(False))
+    seen_store.ack(nonce, sent)
+    return sent
+
+
 # ── 朝のフィード定義 ──────────────────────────────────────
 MORNING_FEED_NAMES = {"Qiita トレンド", "Zenn トレンド", "GIGAZINE"}
 MORNING_FEEDS = [f for f in RSS_FEEDS if f["name"] in MORNING_FEED_NAMES]
 MORNING_TIME = time(hour=7, minute=0, tzinfo=JST)   # 毎朝 7:00 JST
 WEEKLY_TIME  = time(hour=9, minute=0, tzinfo=JST)   # 毎週日曜 9:00 JST
+RANKING_FEED = "はてなブックマーク IT"   # 週刊ランキングの集計対象
 
 # ── ホットキーワードスコアリング ───────────────────────────
 HOT_KEYWORDS = [
@@ -195,175 +2014,657 @@ HOT_KEYWORDS = [
 ]
 
 
-def score_entry(entry: dict, feed_meta: dict) -> int:
-    """タイトルのホットキーワード数 + フィードボーナスでスコアを返す"""
-    title = entry.get("title", "")
-    score = sum(1 for kw in HOT_KEYWORDS if kw.lower() in title.lower())
-    # Qiita/Zennはエンジニア向け特化なのでボーナス
-    if feed_meta["name"] in ("Qiita トレンド", "Zenn トレンド"):
-        score += 1
-    return score
+def _parse_weights(spec: str) -> dict[str, int]:
+    """"AI=2,Rust=3" 形式の重み指定を読む"""
+    weights = {}
+    for item in spec.split(","):
+        keyword, _, weight = item.partition("=")
+        if not keyword.strip():
+            continue
+        try:
+            weights[keyword.strip()] = int(weight or 1)
+        except ValueError:
+            print(f"[WARN] KEYWORD_WEIGHTS: 重みが整数ではありません: {item}")
+    return weights
+
+
+def _keyword_regex(keyword: str) -> str:
+    """英数字で始まる・終わるキーワードは前後が英数字でないときだけ一致させる（"Go" が "Google" に一致しない）"""
+    pattern = re.escape(keyword)
+    if keyword[:1].isascii() and keyword[:1].isalnum():
+        pattern = r"(?<![a-z0-9])" + pattern
+    if keyword[-1:].isascii() and keyword[-1:].isalnum():
+        pattern += r"(?![a-z0-9])"
+    return pattern
+
+
+class KeywordScorer:
+    """重み付きキーワードを1つの正規表現にまとめ、タイトルを1回の走査で採点する。
+
+    タイトルは NFKC で正規化してから照合する（全角英数字も一致する）。
+    キーワードは長いものを優先して一致させ、同じキーワードは何回出ても1回だけ数える。
+    """
+
+    def __init__(self, weights: dict[str, int]):
+        self.weights = {unicodedata.normalize("NFKC", kw).lower(): w for kw, w in weights.items()}
+        terms = sorted(self.weights, key=len, reverse=True)
+        self.pattern = re.compile("|".join(_keyword_regex(t) for t in terms), re.IGNORECASE)
+
+    def score(self, title: str) -> int:
+        matched = {m.group().lower() for m in self.pattern.finditer(unicodedata.normalize("NFKC", title))}
+        return sum(self.weights[kw] for kw in matched)
+
+    def score_many(self, titles: list[str]) -> list[int]:
+        """複数のタイトルを連結して1回で走査し、タイトルごとのスコアを返す"""
+        starts = []
+        offset = 0
+        normalized = []
+        for title in titles:
+            text = unicodedata.normalize("NFKC", title).replace("\n", " ")
+            starts.append(offset)
+            normalized.append(text)
+            offset += len(text) + 1
+        matched: list[set[str]] = [set() for _ in titles]
+        for m in self.pattern.finditer("\n".join(normalized)):
+            matched[bisect.bisect_right(starts, m.start()) - 1].add(m.group().lower())
+        return [sum(self.weights[kw] for kw in kws) for kws in matched]
+
+
+keyword_scorer = KeywordScorer({**dict.fromkeys(HOT_KEYWORDS, 1), **_parse_weights(KEYWORD_WEIGHTS)})
+
+
+def score_entry(entry: Article, feed_meta: dict) -> int:
+    """タイトルのホットキーワードの重み + フィードボーナスでスコアを返す"""
+    return keyword_scorer.score(entry.title) + feed_meta.get("bonus", 0)
+
+
+def score_entries(items: list[tuple[dict, Article]]) -> list[int]:
+    """(feed_meta, entry) の並びをまとめて採点する"""
+    scores = keyword_scorer.score_many([entry.title for _, entry in items])
+    return [score + feed_meta.get("bonus", 0) for score, (feed_meta, _) in zip(scores, items)]
+
+
+def top_articles(
+    results: list[tuple[dict, list[tuple[str, Article]]]], k: int,
+) -> list[tuple[dict, Article]]:
+    """収集記事の中からスコア上位 k 本を (feed_meta, entry) で返す（同点は先に出たものを優先）"""
+    items = [(feed_meta, entry) for feed_meta, entries in results for _, entry in entries]
+    scores = score_entries(items)
+    best = heapq.nlargest(k, range(len(items)), key=scores.__getitem__)
+    return [items[i] for i in best]
 
 
 def pick_spotlight(
-    results: list[tuple[dict, list[tuple[str, dict]]]],
-) -> tuple[dict, dict] | None:
+    results: list[tuple[dict, list[tuple[str, Article]]]],
+) -> tuple[dict, Article] | None:
     """収集記事の中から最高スコアの1本を返す"""
-    best: tuple[int, dict, dict] | None = None
-    for feed_meta, entries in results:
-        for _, entry in entries:
-            s = score_entry(entry, feed_meta)
-            if best is None or s > best[0]:
-                best = (s, feed_meta, entry)
-    if best is None:
+    top = top_articles(results, 1)
+    return top[0] if top else None  # (feed_meta, entry)
+
+
+# ── フィルタールール ──────────────────────────────────────
+# フィード (feed_meta["filter"]) と配信先 (routes.json の "filter") に書く宣言的な絞り込み条件。
+#   include_categories / exclude_categories: カテゴリのいずれかを含む / 含まない
+#   title / summary:                         正規表現のいずれかに一致する（大文字小文字を区別しない）
+#   exclude_title / exclude_summary:         正規表現のいずれかに一致しない
+#   authors / exclude_authors:               著者が一覧に含まれる / 含まれない
+#   min_score:                               ホットキーワードのスコア（フィードボーナス込み）がこれ以上
+#   max_age_hours:                           公開からの経過時間がこれ以下（公開日時のない記事は通す）
+# 同じ種類の条件が複数の階層にある場合、除外条件は1つにまとめ、絞り込み条件はすべてを満たす必要がある。
+FILTER_KEYS = frozenset({
+    "include_categories", "exclude_categories", "title", "summary", "exclude_title", "exclude_summary",
+    "authors", "exclude_authors", "min_score", "max_age_hours",
+})
+
+
+class EntryFacts:
+    """ルール評価で使う記事ごとの値。スコアなど重い値は初めて必要になった時に1回だけ計算する"""
+
+    __slots__ = ("entry", "feed_meta", "now", "_score")
+
+    def __init__(self, entry: Article, feed_meta: dict, now: float):
+        self.entry = entry
+        self.feed_meta = feed_meta
+        self.now = now
+        self._score: int | None = None
+
+    @property
+    def score(self) -> int:
+        if self._score is None:
+            self._score = score_entry(self.entry, self.feed_meta)
+        return self._score
+
+
+def _as_list(value) -> list:
+    if value is None:
+        return []
+    if isinstance(value, (str, int, float)):
+        return [value]
+    return list(value)
+
+
+def _merged_pattern(patterns: list[str]) -> re.Pattern | None:
+    """複数の正規表現を1つの選択パターンにまとめる"""
+    patterns = [p for p in patterns if p]
+    if not patterns:
+        return None
+    return re.compile("|".join(f"(?:{p})" for p in patterns), re.IGNORECASE)
+
+
+def compile_filter(*specs: dict | None) -> Callable[[EntryFacts], bool] | None:
+    """ルールを1つの判定関数にコンパイルする。条件が1つもなければ None を返す。
+
+    判定は安い条件（カテゴリ・著者・経過時間）から順に行い、スコアは最後に必要な時だけ計算する。
+    未知のキーや不正な正規表現は ValueError / re.error を送出する。
+    """
+    include_categories: list[frozenset] = []
+    exclude_categories: set[str] = set()
+    authors: list[frozenset] = []
+    exclude_authors: set[str] = set()
+    title_include: list[re.Pattern] = []
+    summary_include: list[re.Pattern] = []
+    title_exclude: list[str] = []
+    summary_exclude: list[str] = []
+    min_score: int | None = None
+    max_age: float | None = None
+
+    for spec in specs:
+        if not spec:
+            continue
+        unknown = set(spec) - FILTER_KEYS
+        if unknown:
+            raise ValueError(f"未知のフィルター条件: {sorted(unknown)}")
+        if spec.get("include_categories"):
+            include_categories.append(frozenset(_as_list(spec["include_categories"])))
+        exclude_categories.update(_as_list(spec.get("exclude_categories")))
+        if spec.get("authors"):
+            authors.append(frozenset(a.casefold() for a in _as_list(spec["authors"])))
+        exclude_authors.update(a.casefold() for a in _as_list(spec.get("exclude_authors")))
+        for key, include in (("title", title_include), ("summary", summary_include)):
+            pattern = _merged_pattern(_as_list(spec.get(key)))
+            if pattern is not None:
+                include.append(pattern)
+        title_exclude += _as_list(spec.get("exclude_title"))
+        summary_exclude += _as_list(spec.get("exclude_summary"))
+        if spec.get("min_score") is not None:
+            score = int(spec["min_score"])
+            min_score = score if min_score is None else max(min_score, score)
+        if spec.get("max_age_hours") is not None:
+            age = float(spec["max_age_hours"]) * 3600
+            max_age = age if max_age is None else min(max_age, age)
+
+    checks: list[Callable[[EntryFacts], bool]] = []
+    for allowed in include_categories:
+        checks.append(lambda f, allowed=allowed: not allowed.isdisjoint(f.entry.categories))
+    if exclude_categories:
+        denied = frozenset(exclude_categories)
+        checks.append(lambda f: denied.isdisjoint(f.entry.categories))
+    for allowed in authors:
+        checks.append(lambda f, allowed=allowed: (f.entry.author or "").casefold() in allowed)
+    if exclude_authors:
+        denied_authors = frozenset(exclude_authors)
+        checks.append(lambda f: (f.entry.author or "").casefold() not in denied_authors)
+    if max_age is not None:
+        checks.append(lambda f: f.entry.published is None or f.now - f.entry.published <= max_age)
+    for pattern in title_include:
+        checks.append(lambda f, search=pattern.search: search(f.entry.title) is not None)
+    for pattern in summary_include:
+        checks.append(lambda f, search=pattern.search: search(f.entry.summary) is not None)
+    for patterns, field in ((title_exclude, "title"), (summary_exclude, "summary")):
+        pattern = _merged_pattern(patterns)
+        if pattern is not None:
+            checks.append(lambda f, search=pattern.search, field=field: search(getattr(f.entry, field)) is None)
+    if min_score is not None:
+        checks.append(lambda f: f.score >= min_score)
+
+    if not checks:
         return None
-    return best[1], best[2]  # (feed_meta, entry)
+    if len(checks) == 1:
+        return checks[0]
 
+    def predicate(facts: EntryFacts) -> bool:
+        for check in checks:
+            if not check(facts):
+                return False
+        return True
+    return predicate
 
-# ── フィードチェック共通処理 ──────────────────────────────
-async def _check_feeds(channel, feeds: list[dict], max_per_feed: int | None = None, shuffle: bool = False) -> int:
-    """指定されたフィード一覧をチェックし新着記事を投稿する。投稿件数を返す。
+
+def feed_filter(feed_meta: dict) -> Callable[[EntryFacts], bool] | None:
+    """フィード定義のルールをコンパイルし、feed_meta に保持して使い回す"""
+    if "_filter" not in feed_meta:
+        feed_meta["_filter"] = compile_filter(feed_meta.get("filter"))
+    return feed_meta["_filter"]
+
+
+# ── 配信ルーティング ──────────────────────────────────────
+POLL_FEEDS = RSS_FEEDS if POLL_MORNING_FEEDS else [f for f in RSS_FEEDS if f["name"] not in MORNING_FEED_NAMES]
+
+
+class Route:
+    """フィードとフィルターを配信先チャンネルに対応づける購読設定。
+
+    既読は配信先ごとに管理する。namespace が None のルートはフィード名をそのまま既読キーにする
+    （DISCORD_CHANNEL_ID への既定ルートと手動コマンドが該当し、従来の既読データを引き継ぐ）。
+    """
+
+    def __init__(
+        self,
+        channel_id: int,
+        feeds=None,
+        keywords=(),
+        exclude=(),
+        digest: bool = False,
+        namespace: str | None = None,
+        rules: dict | None = None,
+    ):
+        self.channel_id = channel_id
+        self.feeds = set(feeds) if feeds is not None else None
+        # keywords / exclude はタイトルの部分一致（フィルタールールの title / exclude_title に変換する）
+        keyword_rules = {
+            "title": [re.escape(w) for w in keywords if w],
+            "exclude_title": [re.escape(w) for w in exclude if w],
+        }
+        self.filter = compile_filter(keyword_rules, rules)
+        self.digest = digest
+        self.namespace = namespace
+
+    def wants(self, feed_name: str) -> bool:
+        """このフィードを購読しているか"""
+        return self.feeds is None or feed_name in self.feeds
+
+    def accepts(self, facts: EntryFacts) -> bool:
+        """記事がこの配信先のフィルター条件を満たすか"""
+        return self.filter is None or self.filter(facts)
+
+    def seen_key(self, feed_name: str) -> str:
+        return feed_name if self.namespace is None else f"{feed_name}@{self.namespace}"
+
+
+def load_routes(path: Path) -> list[Route]:
+    """ルーティング表を読み込む。ファイルがなければ DISCORD_CHANNEL_ID への既定ルートだけを返す。
+
+    ファイルは {"channel", "feeds", "keywords", "exclude", "filter", "digest"} の配列で、
+    feeds を省略すると随時投稿の対象フィードすべてを購読する。filter はフィルタールールの辞書。
+    """
+    poll_names = [f["name"] for f in POLL_FEEDS]
+    if not path.exists():
+        return [Route(CHANNEL_ID, feeds=poll_names, digest=True)]
+    try:
+        table = json.loads(path.read_text(encoding="utf-8"))
+    except (json.JSONDecodeError, OSError) as e:
+        print(f"[ERROR] ルーティング表を読み込めません ({path.name}): {e}")
+        return [Route(CHANNEL_ID, feeds=poll_names, digest=True)]
+
+    known = {f["name"] for f in RSS_FEEDS}
+    routes = []
+    for spec in table:
+        try:
+            channel_id = int(spec["channel"])
+        except (KeyError, TypeError, ValueError):
+            print(f"[WARN] ルーティング表: channel のない設定を無視します: {spec}")
+            continue
+        feeds = spec.get("feeds", poll_names)
+        unknown = set(feeds) - known
+        if unknown:
+            print(f"[WARN] ルーティング表: 未定義のフィード {sorted(unknown)} (channel {channel_id})")
+        try:
+            route = Route(
+                channel_id,
+                feeds=feeds,
+                keywords=spec.get("keywords", ()),
+                exclude=spec.get("exclude", ()),
+                digest=spec.get("digest", channel_id == CHANNEL_ID),
+                namespace=None if channel_id == CHANNEL_ID else str(channel_id),
+                rules=spec.get("filter"),
+            )
+        except (ValueError, TypeError, re.error) as e:
+            print(f"[WARN] ルーティング表: filter が不正なため設定を無視します (channel {channel_id}): {e}")
+            continue
+        routes.append(route)
+    return routes
+
+
+ROUTES = load_routes(ROUTES_FILE)
+# いずれかのルートが購読しているフィードと、ランキングを集計するフィードだけをポーリングする
+ROUTED_FEEDS = [
+    f for f in RSS_FEEDS if f.get("ranking") or any(route.wants(f["name"]) for route in ROUTES)
+]
+
+
+async def resolve_channel(channel_id: int):
+    """チャンネルをキャッシュから引き、なければ API で取得する。見つからなければ None"""
+    channel = bot.get_channel(channel_id)
+    if channel is not None:
+        return channel
+    try:
+        return await bot.fetch_channel(channel_id)
+    except (discord.HTTPException, discord.InvalidData) as e:
+        print(f"[ERROR] チャンネル {channel_id} が見つかりません: {e}")
+        return None
+
+
+async def digest_channels() -> list:
+    """朝のまとめ・週刊ランキングの配信先チャンネル"""
+    channels = []
+    for route in ROUTES:
+        if route.digest:
+            channel = await resolve_channel(route.channel_id)
+            if channel is not None:
+                channels.append(channel)
+    return channels
+
+
+async def broadcast(channels: list, label: str, items: list[tuple[str, str]] | None = None, **kwargs) -> int:
+    """同じメッセージを複数チャンネルへ並行して送り、送れた数を返す。
+
+    items に (既読キー, 記事ID) を渡すと送信箱に記録してから Embed を送り、
+    いずれかのチャンネルに送れた記事を既読にする（確定は seen_store.commit()）。
+    """
+    if items:
+        embed = kwargs["embed"]
+        groups = [list(items)]
+        messages = [(channel, outbox_nonce(channel.id, groups)) for channel in channels]
+        payload = json.dumps([embed.to_dict()], ensure_ascii=False)
+        seen_store.stage([(nonce, channel.id, groups, payload) for channel, nonce in messages])
+        results = await asyncio.gather(*(send_staged(channel, nonce, [embed]) for channel, nonce in messages))
+        return sum(1 for sent in results if all(sent))
+    results = await asyncio.gather(
+        *(dispatcher.send(channel, **kwargs) for channel in channels), return_exceptions=True
+    )
+    for channel, result in zip(channels, results):
+        if isinstance(result, discord.HTTPException):
+            print(f"[ERROR] {label}送信失敗 (channel {getattr(channel, 'id', '?')}): {result}")
+            EMBEDS_FAILED.inc(str(getattr(channel, "id", "?")), amount=len(kwargs.get("embeds", [kwargs.get("embed")])))
+        elif isinstance(result, BaseException):
+            raise result
+    return sum(1 for result in results if not isinstance(result, BaseException))
+
+
+# ── 配信パイプライン ──────────────────────────────────────
+# 取得 (fetch_feeds) → 選別 (select_stage) → Embed 作成 (render_stage) → 送信 (dispatch_sink) を
+# 非同期ジェネレータでつなぐ。段の間はフィード単位で流れ、できたものから次の段へ進む。
+# 随時投稿・!news・朝のまとめは同じ段を使い、最後の受け手 (sink) だけが異なる。
+class FeedBatch:
+    """パイプラインを流れる1フィード分の処理単位"""
+
+    __slots__ = ("feed_meta", "deliveries", "embeds")
+
+    def __init__(self, feed_meta: dict, deliveries: list[tuple[object, str, list[tuple[str, Article]]]]):
+        self.feed_meta = feed_meta
+        self.deliveries = deliveries   # (配信先チャンネル, 既読キー, [(記事ID, 記事)])
+        self.embeds: dict[str, discord.Embed] = {}
+
+
+def _drop_duplicates(
+    scope: str, feed_name: str, key: str, entries: list[tuple[str, Article]],
+) -> list[tuple[str, Article]]:
+    """重複索引に登録できた記事だけを残し、他フィードと重複した記事は既読にする"""
+    kept = []
+    for aid, entry in entries:
+        duplicate = duplicate_index.claim(scope, feed_name, aid, entry)
+        if duplicate is None:
+            kept.append((aid, entry))
+        else:
+            DUPLICATES.inc(feed_name, duplicate[1])
+            seen_store.add(key, aid)
+    return kept
+
+
+def _known_by(destinations: list[tuple[object, Route]]) -> Callable[[dict, Article], bool]:
+    """購読中のすべての配信先で既読かを判定する関数（ストリーミングパースの打ち切り用）。
+
+    フィードや配信先のフィルターで除外される記事は既読にならないので、投稿しない記事として既読と同じに扱う。
+    どの配信先も購読していないフィードは既読扱いにしない（読み込みを打ち切らない）。
+    """
+    def known(feed_meta: dict, entry: Article) -> bool:
+        feed_name = feed_meta["name"]
+        routes = [route for _, route in destinations if route.wants(feed_name)]
+        if not routes:
+            return False
+        facts = EntryFacts(entry, feed_meta, datetime.now(timezone.utc).timestamp())
+        rule = feed_filter(feed_meta)
+        if rule is not None and not rule(facts):
+            return True
+        return all(seen_store.is_seen(route.seen_key(feed_name), entry.id) or not route.accepts(facts)
+                   for route in routes)
+    return known
+
+
+async def select_stage(
+    source,
+    destinations: list[tuple[object, Route]],
+    max_per_feed: int | None = None,
+    shuffle: bool = False,
+    on_fetched: Callable[[dict, ParsedFeed], None] | None = None,
+):
+    """取得結果から配信先ごとに投稿する記事を選ぶ段（フィルタールール、既読・重複除外、件数制限）。
 
     Args:
         max_per_feed: 1フィードあたりの最大投稿件数。None の場合は無制限。
         shuffle: True の場合、新着記事をランダムに並び替えて投稿する。
+        on_fetched: フィード取得ごとに (feed_meta, feed) を受け取るコールバック。
     """
-    seen = load_seen()
-    new_count = 0
-
-    async with aiohttp.ClientSession() as session:
-        for feed_meta in feeds:
+    async with aclosing(source):
+        async for feed_meta, feed in source:
             feed_name = feed_meta["name"]
-            feed = await fetch_feed(session, feed_meta["url"])
+            if on_fetched is not None:
+                on_fetched(feed_meta, feed)
 
+            targets = [(channel, route) for channel, route in destinations if route.wants(feed_name)]
+            if not targets:
+                continue
             if not feed or not feed.get("entries"):
                 print(f"[WARN] {feed_name}: エントリなし")
                 continue
 
-            if feed_name not in seen:
-                seen[feed_name] = []
-
-            # カテゴリフィルター（feedメタに"categories"が指定されている場合のみ絞り込む）
-            allowed_categories = feed_meta.get("categories")
-
-            # 新着を古い順に並べて投稿
-            new_entries = []
-            for entry in feed.entries:
-                # カテゴリフィルタリング
-                if allowed_categories:
-                    subject = entry.get("tags", [])
-                    # feedparserはdc:subjectをtagsに格納する（カンマ区切り文字列の場合あり）
-                    entry_cats = set()
-                    for t in subject:
-                        for part in t.get("term", "").split(","):
-                            entry_cats.add(part.strip())
-                    if not entry_cats & allowed_categories:
-                        continue
-                aid = article_id(entry)
-                if aid not in seen[feed_name]:
-                    new_entries.append((aid, entry))
-
-            # ランダム取得の場合はシャッフル
-            if shuffle:
-                import random
-                random.shuffle(new_entries)
-
-            # 初回起動時は最新5件だけ投稿（大量投稿防止）
-            init_limit = max_per_feed if max_per_feed is not None else 5
-            if not seen[feed_name] and len(new_entries) > init_limit:
-                skipped = new_entries[:-init_limit]
-                for aid, _ in skipped:
-                    seen[feed_name].append(aid)
-                new_entries = new_entries[-init_limit:]
-
-            # 件数上限を適用（最新の記事を優先）
-            if max_per_feed is not None and len(new_entries) > max_per_feed:
-                skipped = new_entries[:-max_per_feed]
-                for aid, _ in skipped:
-                    seen[feed_name].append(aid)
-                new_entries = new_entries[-max_per_feed:]
-
-            for aid, entry in new_entries:
-                embed = make_embed(entry, feed_meta)
+            FEED_ENTRIES.inc(feed_name, amount=len(feed.entries))
+            with stage_timer("filter", feed_name):
+                # フィード単位のルールは配信先の数にかかわらず記事ごとに1回だけ評価する
+                now = datetime.now(timezone.utc).timestamp()
+                rule = feed_filter(feed_meta)
+                candidates = []
+                for entry in feed.entries:
+                    facts = EntryFacts(entry, feed_meta, now)
+                    if rule is None or rule(facts):
+                        candidates.append((entry.id, entry, facts))
+
+                # ランダム取得の場合はシャッフル（全配信先で同じ順序を使う）
+                if shuffle:
+                    random.shuffle(candidates)
+
+                # 配信先ごとに未読の記事を選ぶ（新着を古い順に並べて投稿）
+                deliveries = []
+                for channel, route in targets:
+                    key = route.seen_key(feed_name)
+                    new_entries = [
+                        (aid, entry) for aid, entry, facts in candidates
+                        if not seen_store.is_seen(key, aid) and route.accepts(facts)
+                    ]
+
+                    # 初回は最新5件だけ投稿（大量投稿防止）
+                    init_limit = max_per_feed if max_per_feed is not None else 5
+                    if not seen_store.has_feed(key) and len(new_entries) > init_limit:
+                        for aid, _ in new_entries[:-init_limit]:
+                            seen_store.add(key, aid)
+                        new_entries = new_entries[-init_limit:]
+
+                    # 件数上限を適用（最新の記事を優先）
+                    if max_per_feed is not None and len(new_entries) > max_per_feed:
+                        for aid, _ in new_entries[:-max_per_feed]:
+                            seen_store.add(key, aid)
+                        new_entries = new_entries[-max_per_feed:]
+
+                    # 他フィードで既に投稿した記事は見送って既読にする
+                    new_entries = _drop_duplicates(route.namespace or "", feed_name, key, new_entries)
+                    deliveries.append((channel, key, new_entries))
+
+            yield FeedBatch(feed_meta, deliveries)
+
+
+async def render_stage(source):
+    """Embed を作る段。配信先の数にかかわらず記事ごとに1回だけ作り、全配信先で使い回す"""
+    async with aclosing(source):
+        async for batch in source:
+            with stage_timer("embed", batch.feed_meta["name"]):
+                for _, _, entries in batch.deliveries:
+                    for aid, entry in entries:
+                        if aid not in batch.embeds:
+                            batch.embeds[aid] = make_embed(entry, batch.feed_meta)
+            yield batch
+
+
+async def drain(source, worker: Callable, concurrency: int) -> None:
+    """source の要素を最大 concurrency 件まで並行して worker に渡す。
+
+    空いた worker だけが次の要素を取り出すので、送信が詰まると上流の段も止まる。
+    """
+    lock = asyncio.Lock()
+
+    async def run() -> None:
+        while True:
+            async with lock:
                 try:
-                    await channel.send(embed=embed)
-                    new_count += 1
-                except discord.HTTPException as e:
-                    print(f"[ERROR] 送信失敗: {e}")
-                    continue
+                    item = await anext(source)
+                except StopAsyncIteration:
+                    return
+            await worker(item)
+
+    tasks = [asyncio.create_task(run()) for _ in range(max(concurrency, 1))]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await source.aclose()
 
-                seen[feed_name].append(aid)
-                await asyncio.sleep(1)  # レートリミット対策
 
-            # 既読リストが大きくなりすぎないよう制限
-            if len(seen[feed_name]) > 500:
-                seen[feed_name] = seen[feed_name][-300:]
+async def dispatch_sink(source, concurrency: int = SEND_CONCURRENCY) -> int:
+    """チャンネルへ投稿する受け手。送信箱に記録してから配信先ごとに並行して送り、送れた記事だけを既読にする。投稿件数を返す。
 
-    save_seen(seen)
+    複数フィードを並行して処理しても、同じチャンネルへは前のフィードの送信が終わってから送るので投稿順は受け取った順になる。
+    """
+    new_count = 0
+    # チャンネルIDごとの直前のフィードの送信タスク
+    tails: dict[int, asyncio.Task] = {}
+
+    async def send_in_order(channel, messages: list[tuple[str, list[discord.Embed]]], previous) -> list[list[bool]]:
+        if previous is not None:
+            await asyncio.wait([previous])
+        return [await send_staged(channel, nonce, packed) for nonce, packed in messages]
+
+    async def deliver(batch: FeedBatch) -> None:
+        nonlocal new_count
+        feed_name = batch.feed_meta["name"]
+        # 1メッセージに最大10件の Embed を詰め、送る前に全配信先の分をまとめて送信箱に書き込む
+        # Embed の JSON は記事ごとに1回だけ作り、全配信先で使い回す
+        encoded: dict[str, str] = {}
+        messages: dict[int, tuple[object, list]] = {}
+        staged = []
+        for channel, key, entries in batch.deliveries:
+            aids = {id(batch.embeds[aid]): aid for aid, _ in entries}
+            for packed in pack_embeds([batch.embeds[aid] for aid, _ in entries]):
+                packed_aids = [aids[id(embed)] for embed in packed]
+                for aid, embed in zip(packed_aids, packed):
+                    if aid not in encoded:
+                        encoded[aid] = json.dumps(embed.to_dict(), ensure_ascii=False)
+                items = [[(key, aid)] for aid in packed_aids]
+                nonce = outbox_nonce(channel.id, items)
+                messages.setdefault(channel.id, (channel, []))[1].append((nonce, packed))
+                staged.append((nonce, channel.id, items, "[" + ",".join(encoded[aid] for aid in packed_aids) + "]"))
+        seen_store.stage(staged)
+        # 受け取った順に各チャンネルの送信を前のフィードの後ろにつなぐ（ここまで await しないので順序が保たれる）
+        sends = []
+        for channel_id, (channel, channel_messages) in messages.items():
+            task = asyncio.create_task(send_in_order(channel, channel_messages, tails.get(channel_id)))
+            tails[channel_id] = task
+            sends.append(task)
+        with stage_timer("send", feed_name):
+            results = await asyncio.gather(*sends)
+        posted = sum(sum(sent) for channel_results in results for sent in channel_results)
+        new_count += posted
+        ARTICLES_POSTED.inc(feed_name, amount=posted)
+        # フィード単位で送信結果と既読をまとめて書き込む（件数超過分はここで切り詰められる）
+        seen_store.commit()
+
+    await drain(source, deliver, concurrency)
     return new_count
 
 
-# ── 朝ニュース用: 記事を収集する（投稿なし） ───────────────────
-async def _collect_morning_articles(max_per_feed: int = 2) -> tuple[list[tuple], dict]:
-    """朝のフィードから新着記事を収集し、(feed_meta, entries)のリストとupdated seenを返す。"""
-    seen = load_seen()
-    results: list[tuple[dict, list[tuple[str, dict]]]] = []
+async def replay_outbox(channels: dict | None = None) -> int:
+    """前回の実行で送信結果が確定しなかったメッセージを同じ nonce で送り直す。送れた件数を返す。
 
-    async with aiohttp.ClientSession() as session:
-        for feed_meta in MORNING_FEEDS:
-            feed_name = feed_meta["name"]
-            feed = await fetch_feed(session, feed_meta["url"])
+    送信済みだった場合は Discord が nonce で重複を弾くので、同じ記事が2回投稿されることはない
+    （nonce が有効な数分以内に再起動した場合。それ以降は重複して投稿されることがある）。
+    channels（チャンネルID → 送信先）を渡すと、その宛先の分だけを送り直す。
+    """
+    messages = seen_store.recovered(None if channels is None else set(channels))
+    if not messages:
+        return 0
+    sent_count = 0
+    for nonce, channel_id, _, payload in messages:
+        channel = channels[channel_id] if channels is not None else await resolve_channel(channel_id)
+        if channel is None:
+            seen_store.ack(nonce, [False] * len(payload))
+            continue
+        embeds = [discord.Embed.from_dict(data) for data in payload]
+        sent_count += all(await send_staged(channel, nonce, embeds))
+    seen_store.commit()
+    print(f"[INFO] 送信箱から {sent_count}/{len(messages)} 件のメッセージを再送しました")
+    return sent_count
+
+
+async def _check_feeds(
+    channel,
+    feeds: list[dict],
+    max_per_feed: int | None = None,
+    shuffle: bool = False,
+    on_fetched: Callable[[dict, ParsedFeed], None] | None = None,
+) -> int:
+    """指定されたフィード一覧をチェックし新着記事を1つのチャンネルに投稿する。投稿件数を返す。"""
+    route = Route(getattr(channel, "id", 0))
+    return await _deliver_feeds([(channel, route)], feeds, max_per_feed, shuffle, on_fetched)
+
+
+async def _deliver_feeds(
+    destinations: list[tuple[object, Route]],
+    feeds: list[dict],
+    max_per_feed: int | None = None,
+    shuffle: bool = False,
+    on_fetched: Callable[[dict, ParsedFeed], None] | None = None,
+) -> int:
+    """フィードを1回ずつ取得・パースし、購読している配信先それぞれに新着記事を投稿する。投稿件数の合計を返す。
+
+    取得は並列に進め、feeds の順に選別・Embed 作成・送信へ進むので、投稿順は取得にかかった時間によらず毎回同じになる。
+    """
+    fetched = fetch_feeds(get_http_session(), feeds, is_known=_known_by(destinations))
+    selected = select_stage(fetched, destinations, max_per_feed, shuffle, on_fetched)
+    return await dispatch_sink(render_stage(selected))
 
-            if not feed or not feed.get("entries"):
-                print(f"[WARN] {feed_name}: エントリなし")
-                continue
 
-            if feed_name not in seen:
-                seen[feed_name] = []
-
-            allowed_categories = feed_meta.get("categories")
-
-            new_entries = []
-            for entry in feed.entries:
-                if allowed_categories:
-                    entry_cats = set()
-                    for t in entry.get("tags", []):
-                        for part in t.get("term", "").split(","):
-                            entry_cats.add(part.strip())
-                    if not entry_cats & allowed_categories:
-                        continue
-                aid = article_id(entry)
-                if aid not in seen[feed_name]:
-                    new_entries.append((aid, entry))
-
-            # 初回起動時は最新件のみ（大量投稿防止）
-            if not seen[feed_name] and len(new_entries) > max_per_feed:
-                for aid, _ in new_entries[:-max_per_feed]:
-                    seen[feed_name].append(aid)
-                new_entries = new_entries[-max_per_feed:]
-
-            if len(new_entries) > max_per_feed:
-                for aid, _ in new_entries[:-max_per_feed]:
-                    seen[feed_name].append(aid)
-                new_entries = new_entries[-max_per_feed:]
-
-            # 既読に追加
-            for aid, _ in new_entries:
-                seen[feed_name].append(aid)
-
-            if len(seen[feed_name]) > 500:
-                seen[feed_name] = seen[feed_name][-300:]
-
-            if new_entries:
-                results.append((feed_meta, new_entries))
-
-    save_seen(seen)
+# ── 朝ニュース用: 記事を収集する（投稿なし） ───────────────────
+async def _collect_morning_articles(max_per_feed: int = 2) -> list[tuple[dict, list[tuple[str, Article]]]]:
+    """朝のフィードから新着記事を収集し、MORNING_FEEDS の順に (feed_meta, entries) のリストを返す。
+
+    既読にするのは投稿できてから（呼び出し側の責任）。
+    """
+    destinations = [(None, Route(0))]
+    fetched = fetch_feeds(get_http_session(), MORNING_FEEDS, is_known=_known_by(destinations))
+    results = []
+    async with aclosing(select_stage(fetched, destinations, max_per_feed)) as selected:
+        async for batch in selected:
+            _, _, entries = batch.deliveries[0]
+            if entries:
+                results.append((batch.feed_meta, entries))
+    order = {feed_meta["name"]: i for i, feed_meta in enumerate(MORNING_FEEDS)}
+    results.sort(key=lambda result: order.get(result[0]["name"], len(order)))
     return results
 
 
 # ── 朝の定時ニュース (Qiita / Zenn / GIGAZINE) ───────────
-async def _post_morning_news(channel) -> None:
-    """朝のテックニュースを1つのEmbedにまとめて投稿する"""
+async def _post_morning_news(channels: list) -> None:
+    """朝のテックニュースを1つのEmbedにまとめ、各配信先に投稿する"""
     results = await _collect_morning_articles(max_per_feed=2)
 
     if not results:
@@ -379,8 +2680,8 @@ async def _post_morning_news(channel) -> None:
     description = ""
     if spotlight:
         sp_feed, sp_entry = spotlight
-        sp_title = sp_entry.get("title", "タイトルなし")
-        sp_link  = sp_entry.get("link", "")
+        sp_title = sp_entry.title or "タイトルなし"
+        sp_link  = sp_entry.link
         spotlight_link = sp_link
         description = f"⭐ **今日の注目**\n[🔗 {sp_title}]({sp_link})\n\n━━━━━━━━"
 
@@ -395,11 +2696,11 @@ async def _post_morning_news(channel) -> None:
     for feed_meta, entries in results:
         lines = []
         for _, entry in entries:
-            link = entry.get("link", "")
+            link = entry.link
             # 注目記事と同じURLはフィード一覧から除外（重複防止）
             if spotlight_link and link == spotlight_link:
                 continue
-            title = entry.get("title", "タイトルなし")
+            title = entry.title or "タイトルなし"
             lines.append(f"[🔗 {title}]({link})")
             total += 1
         if not lines:
@@ -412,10 +2713,13 @@ async def _post_morning_news(channel) -> None:
 
     embed.set_footer(text=f"計 {total} 件 | 毎朝 7:00 JST 配信")
 
-    try:
-        await channel.send(embed=embed)
-    except discord.HTTPException as e:
-        print(f"[ERROR] 朝ニュース送信失敗: {e}")
+    # 投稿できた記事だけを既読にする（注目記事と重複して一覧から外した記事も含む）
+    items = [(feed_meta["name"], aid) for feed_meta, entries in results for aid, _ in entries]
+    sent = await broadcast(channels, "朝ニュース", items=items, embed=embed)
+    if sent:
+        seen_store.set_meta(LAST_DIGEST_KEY, datetime.now(JST).date().isoformat())
+    seen_store.commit()
+    if not sent:
         return
 
     now = datetime.now(JST).strftime("%Y-%m-%d %H:%M:%S")
@@ -425,16 +2729,16 @@ async def _post_morning_news(channel) -> None:
 @tasks.loop(time=MORNING_TIME)
 async def morning_news():
     """毎朝 7:00 JST に Qiita・Zenn・GIGAZINE の最新記事を投稿する"""
-    channel = bot.get_channel(CHANNEL_ID)
-    if channel is None:
-        print(f"[ERROR] チャンネル {CHANNEL_ID} が見つかりません")
+    channels = await digest_channels()
+    if not channels:
         return
-    await _post_morning_news(channel)
+    await _post_morning_news(channels)
 
 
 @morning_news.before_loop
 async def before_morning_news():
     await bot.wait_until_ready()
+    await startup_done.wait()
 
 
 @morning_news.error
@@ -448,74 +2752,295 @@ async def morning_news_error(error):
         morning_news.restart()
 
 
+# ── 適応ポーリング ────────────────────────────────────────
+class FeedScheduler:
+    """フィードごとの次回ポーリング時刻を管理する。
+
+    間隔はフィードの実際の更新頻度（直近エントリの公開間隔の中央値の半分）に合わせ、
+    POLL_MIN_MINUTES〜POLL_MAX_MINUTES に収める。取得に失敗すると失敗回数に応じて間隔を倍々に延ばす。
+    """
+
+    def __init__(self, feeds: list[dict], base_minutes: int):
+        self.feeds = feeds
+        self.base = base_minutes * 60
+        now = monotonic()
+        self.state: dict[str, dict] = {}
+        for i, feed_meta in enumerate(feeds):
+            # 初回はベース間隔の中に均等にばらして一斉に取りに行かないようにする
+            offset = self.base * i / max(len(feeds), 1)
+            self.state[feed_meta["name"]] = {"interval": self.base, "failures": 0, "next": now + offset}
+
+    def _jittered(self, seconds: float) -> float:
+        return seconds * (1 + random.uniform(-POLL_JITTER, POLL_JITTER))
+
+    def due(self) -> list[dict]:
+        """ポーリング時刻を過ぎたフィードを返す（結果が出るまで次回時刻を仮に進めておく）"""
+        now = monotonic()
+        feeds = []
+        for feed_meta in self.feeds:
+            state = self.state[feed_meta["name"]]
+            if state["next"] <= now:
+                state["next"] = now + self._jittered(state["interval"])
+                feeds.append(feed_meta)
+        return feeds
+
+    def observe(self, feed_meta: dict, feed: ParsedFeed) -> None:
+        """取得結果から次回ポーリングまでの間隔を決める"""
+        state = self.state.get(feed_meta["name"])
+        if state is None:
+            return
+        if "entries" not in feed:
+            # fetch_feed は失敗時に空の ParsedFeed を返す
+            state["failures"] += 1
+            interval = min(state["interval"] * 2 ** state["failures"], POLL_MAX_MINUTES * 60)
+        else:
+            state["failures"] = 0
+            interval = self._estimate_interval(feed.entries)
+            state["interval"] = interval
+        state["next"] = monotonic() + self._jittered(interval)
+
+    def _estimate_interval(self, entries: list) -> float:
+        stamps = sorted((e.published for e in entries[:20] if e.published is not None), reverse=True)
+        gaps = [a - b for a, b in zip(stamps, stamps[1:]) if a > b]
+        if not gaps:
+            return self.base
+        return min(max(median(gaps) / 2, POLL_MIN_MINUTES * 60), POLL_MAX_MINUTES * 60)
+
+    def next_poll(self, feed_name: str) -> float | None:
+        """次回ポーリングまでの秒数"""
+        state = self.state.get(feed_name)
+        return None if state is None else max(state["next"] - monotonic(), 0.0)
+
+
+scheduler = FeedScheduler(ROUTED_FEEDS, CHECK_INTERVAL_MINUTES)
+
+
+@tasks.loop(seconds=30)
+async def feed_poller():
+    """ポーリング時刻を迎えたフィードの新着記事を購読中の配信先に投稿する"""
+    feeds = scheduler.due()
+    if not feeds:
+        return
+    destinations = []
+    for route in ROUTES:
+        channel = await resolve_channel(route.channel_id)
+        if channel is not None:
+            destinations.append((channel, route))
+    if not destinations:
+        return
+    await _deliver_feeds(destinations, feeds, on_fetched=scheduler.observe)
+
+
+@feed_poller.before_loop
+async def before_feed_poller():
+    await bot.wait_until_ready()
+    await startup_done.wait()
+
+
+@feed_poller.error
+async def feed_poller_error(error):
+    now = datetime.now(JST).strftime("%Y-%m-%d %H:%M:%S")
+    print(f"[{now}] ❌ feed_poller エラー: {error}")
+    import traceback
+    traceback.print_exc()
+    if not feed_poller.is_running():
+        feed_poller.restart()
+
+
+# ── 起動処理 ──────────────────────────────────────────────
+# ゲートウェイへのログインと並行して既読DB・記事アーカイブ・フィードキャッシュ・重複検出の索引を温める。
+# ログイン後は前回の送信箱の再送と、その日まだ投稿していなければ朝のまとめを1回だけ行う。
+# on_ready は再接続のたびに呼ばれるが、起動処理は最初の1回しか行わない。
+LAST_DIGEST_KEY = "last_digest"   # 朝のまとめを最後に投稿した日 (JST, ISO 形式)
+startup_times: dict[str, float] = {}   # 起動の段階ごとの、プロセス起動からの経過秒数
+startup_done = asyncio.Event()         # 定時タスクは最初の実行前にこれを待つ
+metrics.register(CallbackMetric(
+    "newsbot_startup_seconds", "プロセス起動から各段階に到達するまでの秒数", ("phase",),
+    lambda: {(phase,): seconds for phase, seconds in startup_times.items()},
+))
+
+
+def mark_startup(phase: str) -> float:
+    """起動の段階に到達したことを記録し、プロセス起動からの経過秒数を返す"""
+    return startup_times.setdefault(phase, perf_counter() - PROCESS_STARTED)
+
+
+async def _seed_duplicate_index() -> int:
+    """直近に投稿した記事を記事アーカイブから重複検出の索引に戻す。戻した件数を返す"""
+    if duplicate_index.window <= 0:
+        return 0
+    now = datetime.now(timezone.utc).timestamp()
+    namespaces = {None} | {route.namespace for route in ROUTES}
+    seeded = 0
+    for i, (feed, aid, title, link, fetched) in enumerate(archive.recent(now - duplicate_index.window)):
+        entry = Article(aid, title=title, link=link)
+        for namespace in namespaces:
+            key = feed if namespace is None else f"{feed}@{namespace}"
+            if seen_store.is_seen(key, aid):
+                duplicate_index.claim(namespace or "", feed, aid, entry, age=now - fetched)
+                seeded += 1
+        if i % 500 == 499:
+            await asyncio.sleep(0)   # ログイン処理を止めない
+    return seeded
+
+
+async def _warm_feed_cache(url: str) -> bool:
+    """保存済みのフィード本文をパースしておき、初回の 304 応答ですぐ使えるようにする"""
+    if feed_cache.get(url) is not None:
+        return False
+    body = await asyncio.to_thread(feed_cache.body, url)
+    if body is None:
+        return False
+    feed_cache.remember(url, await parse_feed(url, body))
+    return True
+
+
+async def warm_caches() -> None:
+    """ログインと並行して各ストアを開き、キャッシュを温める"""
+    start = perf_counter()
+    seen_store.db
+    archive.db
+    bookmark_ranking.db
+    seeded = await _seed_duplicate_index()
+    urls = {feed_meta["url"] for feed_meta in ROUTED_FEEDS + MORNING_FEEDS}
+    results = await asyncio.gather(*(_warm_feed_cache(url) for url in urls), return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            print(f"[WARN] フィードキャッシュの読み込みに失敗: {type(result).__name__}: {result}")
+    parsed = sum(1 for result in results if result is True)
+    mark_startup("warm")
+    print(f"[INFO] キャッシュ準備完了 ({perf_counter() - start:.2f} 秒): "
+          f"フィード {parsed}/{len(urls)} 件, 重複検出 {seeded} 件")
+
+
+async def startup() -> None:
+    """ログイン後に1回だけ行う起動処理（送信箱の再送 → 定時タスクの解放 → 朝のまとめ）"""
+    try:
+        try:
+            await bot.warm_task
+        except Exception as e:
+            print(f"[WARN] キャッシュの準備に失敗しました（必要になった時に読み込みます）: {type(e).__name__}: {e}")
+        # 前回停止時に送信中だったメッセージを、新しい投稿より先に送り直す
+        await replay_outbox()
+    finally:
+        startup_done.set()
+        print(f"⏱️ 起動完了: プロセス起動から {mark_startup('startup'):.2f} 秒")
+
+    # 朝のまとめがまだなら投稿する（再起動しても同じ日に2回は投稿しない）
+    today = datetime.now(JST).date().isoformat()
+    if seen_store.get_meta(LAST_DIGEST_KEY) == today:
+        print("📰 今日の朝のニュースは投稿済みのため、起動時の投稿を省略します")
+        return
+    channels = await digest_channels()
+    if channels:
+        print("📰 起動時のニュースを投稿中...")
+        await _post_morning_news(channels)
+
+
 # ── Bot 本体 ──────────────────────────────────────────────
+class NewsBot(commands.AutoShardedBot if SHARDED else commands.Bot):
+    """共有HTTPセッションの生成と破棄を受け持つ Bot。
+
+    SHARDED=1 のときは AutoShardedBot としてゲートウェイ接続をシャードに分ける。
+    フィードの取得・パースはシャード数に関係なくプロセス内で1回だけ行う。
+    """
+
+    metrics_runner = None
+    lag_task: asyncio.Task | None = None
+    warm_task: asyncio.Task | None = None
+    startup_task: asyncio.Task | None = None
+
+    async def setup_hook(self) -> None:
+        mark_startup("setup")
+        # イベントループ上でセッションを作っておき、全処理で使い回す
+        get_http_session()
+        self.metrics_runner = await start_metrics_server()
+        self.lag_task = asyncio.create_task(sample_loop_lag())
+        # ゲートウェイへのログインと並行してキャッシュを温める
+        self.warm_task = asyncio.create_task(warm_caches())
+        # 定時タスクはすぐに開始する（最初の実行は起動処理の完了を待つ）
+        for task in (morning_news, weekly_ranking, feed_poller):
+            task.start()
+        print(f"✅ 定時タスク開始 (feed_poller: {len(ROUTED_FEEDS)} フィード)")
+
+    async def close(self) -> None:
+        await super().close()
+        for task in (self.startup_task, self.warm_task, self.lag_task):
+            if task is not None:
+                task.cancel()
+        if self.metrics_runner is not None:
+            await self.metrics_runner.cleanup()
+        await dispatcher.close()
+        await close_http_session()
+        shutdown_parse_executor()
+
+
 intents = discord.Intents.default()
 intents.message_content = True
-bot = commands.Bot(command_prefix="!", intents=intents)
+shard_options = {"shard_count": SHARD_COUNT or None} if SHARDED else {}
+bot = NewsBot(command_prefix="!", intents=intents, http_trace=discord_trace, **shard_options)
 
 
 @bot.event
 async def on_ready():
-    print(f"✅ ログイン完了: {bot.user} (ID: {bot.user.id})")
-    print(f"📡 チャンネルID: {CHANNEL_ID}")
+    # ゲートウェイに再接続するたびに呼ばれるので、起動処理は最初の1回だけ行う
+    if bot.startup_task is not None:
+        print(f"🔄 再接続: {bot.user}")
+        return
+    print(f"✅ ログイン完了: {bot.user} (ID: {bot.user.id}) - プロセス起動から {mark_startup('ready'):.2f} 秒")
+    print(f"📡 配信先: {len(ROUTES)} チャンネル ({', '.join(str(route.channel_id) for route in ROUTES)})")
+    if SHARDED:
+        print(f"🧩 シャード数: {bot.shard_count}")
     print(f"🌅 朝のニュース: 毎日 {MORNING_TIME.strftime('%H:%M')} JST")
-
-    # 起動時に朝のニュースを投稿
-    channel = bot.get_channel(CHANNEL_ID)
-    if channel:
-        print("📰 起動時のニュースを投稿中...")
-        await _post_morning_news(channel)
-    else:
-        print(f"[ERROR] チャンネル {CHANNEL_ID} が見つかりません")
-
-    if not morning_news.is_running():
-        morning_news.start()
-        print("✅ morning_news タスク開始")
-    if not weekly_ranking.is_running():
-        weekly_ranking.start()
-        print("✅ weekly_ranking タスク開始")
+    bot.startup_task = asyncio.create_task(startup())
 
 
 # ── 週刊ランキング (毎週日曜 9:00 JST) ────────────────────
-async def _post_weekly_ranking(channel) -> None:
-    """はてナBM ITホットエントリー TOP5 をランキング形式で投稿する"""
-    async with aiohttp.ClientSession() as session:
-        feed = await fetch_feed(session, "https://b.hatena.ne.jp/hotentry/it.rss")
-
-    if not feed or not feed.get("entries"):
-        print("[WARN] 週刊ランキング: エントリなし")
-        return
-
-    entries = feed.entries[:5]
-    week_start = (datetime.now(JST) - timedelta(days=6)).strftime("%m/%d")
-    week_end   = datetime.now(JST).strftime("%m/%d")
+RANKING_LABELS = {"daily": "今日", "weekly": "今週", "monthly": "今月"}
+RANKING_WINDOW_ALIASES = {
+    "daily": "daily", "day": "daily", "日": "daily", "今日": "daily",
+    "weekly": "weekly", "week": "weekly", "週": "weekly", "今週": "weekly",
+    "monthly": "monthly", "month": "monthly", "月": "monthly", "今月": "monthly",
+}
+
+
+def build_ranking_embed(window: str, feed_name: str, k: int = 5) -> discord.Embed | None:
+    """記録済みのブックマーク数から期間内の TOP k を Embed にする（通信なし）。記録がなければ None"""
+    entries = bookmark_ranking.ranking(window, feed_name, k)
+    if not entries:
+        return None
 
+    now = datetime.now(JST)
+    start = (now - timedelta(seconds=RANKING_WINDOWS[window] - 1)).strftime("%m/%d")
+    feed_meta = next((f for f in RSS_FEEDS if f["name"] == feed_name), None)
     embed = discord.Embed(
-        title=f"🏆 今週のITニュース ランキング TOP5",
-        description=f"{week_start} 〜 {week_end}　|　はてなブックマーク ITホットエントリーより",
-        color=0x00A4DE,
+        title=f"🏆 {RANKING_LABELS[window]}のITニュース ランキング TOP{len(entries)}",
+        description=f"{start} 〜 {now.strftime('%m/%d')}　|　{feed_name} のブックマーク数より",
+        color=feed_meta["color"] if feed_meta else 0x00A4DE,
         timestamp=datetime.now(timezone.utc),
     )
 
-    medals = ["🥇", "🥈", "🥉", "4️⃣", "5️⃣"]
-    for i, entry in enumerate(entries):
-        title  = entry.get("title", "タイトルなし")
-        link   = entry.get("link", "")
-        bcount = getattr(entry, "hatena_bookmarkcount", "") or ""
-        count_str = f"　🔖 {bcount}件" if bcount else ""
+    medals = ["🥇", "🥈", "🥉", "4️⃣", "5️⃣", "6️⃣", "7️⃣", "8️⃣", "9️⃣", "🔟"]
+    for i, (title, link, bcount, _) in enumerate(entries):
         embed.add_field(
-            name=f"{medals[i]}　{title}",
-            value=f"[{link}]({link}){count_str}",
+            name=_truncate(f"{medals[i]}　{title or 'タイトルなし'}", EMBED_TITLE_LIMIT),
+            value=f"[{link}]({link})　🔖 {bcount}件",
             inline=False,
         )
+    return embed
+
+
+async def _post_weekly_ranking(channels: list) -> None:
+    """はてなBM ITの今週のブックマーク数 TOP5 をランキング形式で各配信先に投稿する"""
+    embed = build_ranking_embed("weekly", RANKING_FEED)
+    if embed is None:
+        print("[WARN] 週刊ランキング: 集計データなし")
+        return
 
     embed.set_footer(text="毎週日曜 9:00 JST 配信")
-    try:
-        await channel.send(embed=embed)
+    if await broadcast(channels, "週刊ランキング", embed=embed):
         now = datetime.now(JST).strftime("%Y-%m-%d %H:%M:%S")
         print(f"[{now}] 🏆 週刊ランキング投稿完了")
-    except discord.HTTPException as e:
-        print(f"[ERROR] 週刊ランキング送信失敗: {e}")
 
 
 @tasks.loop(time=WEEKLY_TIME)
@@ -523,75 +3048,362 @@ async def weekly_ranking():
     """毎週日曜 9:00 JST に週刊ランキングを投稿する"""
     if datetime.now(JST).weekday() != 6:  # 6 = 日曜
         return
-    channel = bot.get_channel(CHANNEL_ID)
-    if channel is None:
+    channels = await digest_channels()
+    if not channels:
         return
-    await _post_weekly_ranking(channel)
+    await _post_weekly_ranking(channels)
 
 
 @weekly_ranking.before_loop
 async def before_weekly_ranking():
     await bot.wait_until_ready()
+    await startup_done.wait()
 
 
 # ── コマンド ──────────────────────────────────────────────
 @bot.command(name="ranking")
-async def cmd_ranking(ctx):
-    """手動で週刊ランキングを表示する"""
-    await ctx.send("📥 ランキングを取得中…")
-    await _post_weekly_ranking(ctx.channel)
+async def cmd_ranking(ctx, window: str = "weekly", *, feed: str = ""):
+    """ランキングを表示する（例: !ranking / !ranking daily / !ranking monthly はてな）"""
+    window_key = RANKING_WINDOW_ALIASES.get(window.lower())
+    if window_key is None:
+        # 期間を省略してフィード名だけ指定された場合
+        window_key, feed = "weekly", f"{window} {feed}".strip()
+    feed_name = RANKING_FEED
+    if feed:
+        matches = sorted(name for name in bookmark_ranking.feeds() if feed.lower() in name.lower())
+        if not matches:
+            await dispatcher.send(ctx.channel, f"⚠️ 「{feed}」のランキングはありません", priority=PRIORITY_COMMAND)
+            return
+        feed_name = matches[0]
+    embed = build_ranking_embed(window_key, feed_name)
+    if embed is None:
+        await dispatcher.send(ctx.channel, "⚠️ まだ集計データがありません", priority=PRIORITY_COMMAND)
+        return
+    await dispatcher.send(ctx.channel, embed=embed, priority=PRIORITY_COMMAND)
+
+
+SEARCH_PAGE_SIZE = 5
+_SINCE_UNITS = {"h": 3600, "d": 86400, "w": 7 * 86400}
+
+
+def _parse_since(value: str) -> float | None:
+    """"7d" / "12h" / "2w" / "2024-05-01" を UNIX 時刻にする"""
+    match = re.fullmatch(r"(\d+)([hdw])", value)
+    if match:
+        return datetime.now(timezone.utc).timestamp() - int(match.group(1)) * _SINCE_UNITS[match.group(2)]
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=JST).timestamp()
+    except ValueError:
+        return None
+
+
+class SearchView(discord.ui.View):
+    """検索結果のページ送りボタン（検索した本人だけが操作できる）"""
+
+    def __init__(self, author_id: int, query: str, feeds: list[str] | None, since: float | None):
+        super().__init__(timeout=300)
+        self.author_id = author_id
+        self.query = query
+        self.feeds = feeds
+        self.since = since
+        self.page = 0
+
+    def render(self) -> discord.Embed:
+        # 1件多く取って次のページがあるかを判定する
+        rows = archive.search(
+            self.query, self.feeds, self.since, limit=SEARCH_PAGE_SIZE + 1, offset=self.page * SEARCH_PAGE_SIZE
+        )
+        self.previous.disabled = self.page == 0
+        self.next.disabled = len(rows) <= SEARCH_PAGE_SIZE
+        lines = []
+        for feed, title, link, published in rows[:SEARCH_PAGE_SIZE]:
+            date = datetime.fromtimestamp(published, JST).strftime("%Y/%m/%d") if published else "日付不明"
+            lines.append(f"**[{_truncate(title or 'タイトルなし', 200)}]({link})**\n{feed}・{date}")
+        embed = discord.Embed(
+            title=_truncate(f"🔍 「{self.query}」の検索結果", EMBED_TITLE_LIMIT),
+            description="\n\n".join(lines) if lines else "見つかりませんでした",
+            color=0x5865F2,
+        )
+        embed.set_footer(text=f"ページ {self.page + 1} | アーカイブ {archive.rows} 件")
+        return embed
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.author_id:
+            await interaction.response.send_message("検索した本人のみ操作できます", ephemeral=True)
+            return False
+        return True
+
+    @discord.ui.button(label="◀", style=discord.ButtonStyle.secondary)
+    async def previous(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page -= 1
+        await interaction.response.edit_message(embed=self.render(), view=self)
+
+    @discord.ui.button(label="▶", style=discord.ButtonStyle.secondary)
+    async def next(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page += 1
+        await interaction.response.edit_message(embed=self.render(), view=self)
+
+
+@bot.command(name="search")
+async def cmd_search(ctx, *, args: str = ""):
+    """アーカイブから記事を全文検索する（例: !search Rust 非同期 feed:Zenn since:7d）"""
+    words, feeds, since = [], None, None
+    for token in args.split():
+        key, _, value = token.partition(":")
+        if key == "feed" and value:
+            feeds = [f["name"] for f in RSS_FEEDS if value.lower() in f["name"].lower()]
+            if not feeds:
+                await dispatcher.send(ctx.channel, f"⚠️ フィード「{value}」が見つかりません", priority=PRIORITY_COMMAND)
+                return
+        elif key == "since" and value:
+            since = _parse_since(value)
+            if since is None:
+                await dispatcher.send(
+                    ctx.channel, "⚠️ since は 7d / 12h / 2w / 2024-05-01 の形式で指定してください",
+                    priority=PRIORITY_COMMAND,
+                )
+                return
+        else:
+            words.append(token)
+    if not words:
+        await dispatcher.send(ctx.channel, "使い方: `!search <キーワード> [feed:フィード名] [since:7d]`", priority=PRIORITY_COMMAND)
+        return
+
+    view = SearchView(ctx.author.id, " ".join(words), feeds, since)
+    await dispatcher.send(ctx.channel, embed=view.render(), view=view, priority=PRIORITY_COMMAND)
 
 
 @bot.command(name="news")
 async def cmd_news(ctx):
     """手動で最新記事をランダムに取得して投稿する"""
-    await ctx.send("🔄 フィードをチェック中…")
+    await dispatcher.send(ctx.channel, "🔄 フィードをチェック中…", priority=PRIORITY_COMMAND)
     channel = ctx.channel
     new_count = await _check_feeds(channel, MORNING_FEEDS, max_per_feed=5, shuffle=True)
     if new_count == 0:
-        await ctx.send("⚠️ 新着記事がありません（既読済み）")
+        await dispatcher.send(ctx.channel, "⚠️ 新着記事がありません（既読済み）", priority=PRIORITY_COMMAND)
     else:
-        await ctx.send(f"✅ {new_count} 件の記事を投稿しました！")
+        await dispatcher.send(ctx.channel, f"✅ {new_count} 件の記事を投稿しました！", priority=PRIORITY_COMMAND)
 
 
 @bot.command(name="status")
 async def cmd_status(ctx):
     """Botの状態を表示する"""
-    seen = load_seen()
     embed = discord.Embed(
         title="📊 Bot ステータス",
         color=0x5865F2,
     )
     for feed_meta in RSS_FEEDS:
         name = feed_meta["name"]
-        count = len(seen.get(name, []))
-        embed.add_field(name=name, value=f"既読: {count} 件", inline=True)
+        count = seen_store.count(name)
+        value = f"既読: {count} 件"
+        next_poll = scheduler.next_poll(name)
+        if next_poll is not None:
+            state = scheduler.state[name]
+            value += f"\n次回: {next_poll / 60:.0f} 分後 (間隔 {state['interval'] / 60:.0f} 分)"
+        if feed_meta["url"] in parse_times:
+            value += f"\nパース: {parse_times[feed_meta['url']]:.1f} ms"
+        embed.add_field(name=name, value=value, inline=True)
 
     embed.add_field(
         name="チェック間隔",
-        value=f"{CHECK_INTERVAL_MINUTES} 分",
+        value=f"基準 {CHECK_INTERVAL_MINUTES} 分 (フィードごとに {POLL_MIN_MINUTES}〜{POLL_MAX_MINUTES} 分で自動調整)",
+        inline=False,
+    )
+    embed.add_field(
+        name="HTTPキャッシュ",
+        value=f"ヒット: {feed_cache.hits} / ミス: {feed_cache.misses}",
+        inline=False,
+    )
+    embed.add_field(
+        name="記事アーカイブ",
+        value=f"{archive.rows} 件"
+        + (f" (保持 {ARCHIVE_RETENTION_DAYS} 日)" if ARCHIVE_RETENTION_DAYS else " (無期限)"),
+        inline=False,
+    )
+    embed.add_field(
+        name="重複除外",
+        value=f"{sum(DUPLICATES.values.values()):.0f} 件 (直近 {DEDUP_WINDOW_HOURS:g} 時間の {len(duplicate_index)} 記事と照合)",
+        inline=False,
+    )
+    tripped = [
+        f"{host}: {breaker.state} (残り {breaker.remaining():.0f} 秒, 連続失敗 {breaker.failures} 回)"
+        for host, breaker in breakers.items()
+        if breaker.state != "closed"
+    ]
+    embed.add_field(
+        name="サーキットブレーカー",
+        value="\n".join(tripped) if tripped else "すべて正常",
+        inline=False,
+    )
+    avg_wait = dispatcher.wait_total / dispatcher.waits if dispatcher.waits else 0.0
+    embed.add_field(
+        name="送信キュー",
+        value=f"待ち: {dispatcher.depth()} 件 / 平均待ち: {avg_wait:.2f} 秒 / 最大待ち: {dispatcher.wait_max:.2f} 秒",
         inline=False,
     )
+    routes = [
+        f"{route.channel_id}: {len(route.feeds) if route.feeds is not None else len(RSS_FEEDS)} フィード"
+        + (" + まとめ" if route.digest else "")
+        for route in ROUTES
+    ]
+    embed.add_field(name="配信先", value=_truncate("\n".join(routes), 1024), inline=False)
+    if "ready" in startup_times:
+        embed.add_field(
+            name="起動時間",
+            value=" / ".join(f"{phase} {seconds:.2f}s" for phase, seconds in startup_times.items()),
+            inline=False,
+        )
     embed.set_footer(text=f"morning_news タスク稼働中={'✅' if morning_news.is_running() else '❌'}")
-    await ctx.send(embed=embed)
+    await dispatcher.send(ctx.channel, embed=embed, priority=PRIORITY_COMMAND)
+
+
+@bot.command(name="metrics")
+async def cmd_metrics(ctx):
+    """計測値の要約を表示する"""
+    embed = discord.Embed(title="📈 メトリクス", color=0x5865F2)
+    for stage in ("fetch", "parse", "filter", "embed", "send"):
+        lines = []
+        for (name, feed), series in STAGE_SECONDS.values.items():
+            if name != stage:
+                continue
+            count, avg, p95 = STAGE_SECONDS.summary(name, feed)
+            lines.append(f"{feed}: 平均 {avg * 1000:.1f} ms / p95 ≦ {p95 * 1000:.0f} ms ({count} 回)")
+        if lines:
+            embed.add_field(name=stage, value=_truncate("\n".join(lines), 1024), inline=False)
+    count, avg, p95 = LOOP_LAG.summary()
+    total_cache = feed_cache.hits + feed_cache.misses
+    hit_rate = feed_cache.hits / total_cache * 100 if total_cache else 0.0
+    embed.add_field(
+        name="全体",
+        value=(
+            f"ループ遅延: 平均 {avg * 1000:.1f} ms / p95 ≦ {p95 * 1000:.0f} ms\n"
+            f"受信: {sum(FEED_BYTES.values.values()) / 1024:.0f} KiB / "
+            f"エントリ: {sum(FEED_ENTRIES.values.values()):.0f} 件 / "
+            f"投稿: {sum(ARTICLES_POSTED.values.values()):.0f} 件\n"
+            f"HTTPキャッシュ命中率: {hit_rate:.0f}% / 既読ID: {sum(seen_store.sizes().values())} 件"
+        ),
+        inline=False,
+    )
+    if METRICS_PORT:
+        embed.set_footer(text=f"Prometheus: http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    await dispatcher.send(ctx.channel, embed=embed, priority=PRIORITY_COMMAND)
 
 
 @bot.command(name="reset")
 @commands.is_owner()
 async def cmd_reset(ctx):
     """既読データをリセットする（Bot所有者のみ）"""
-    if SEEN_FILE.exists():
-        SEEN_FILE.unlink()
-    await ctx.send("🗑 既読データをリセットしました。")
+    seen_store.reset()
+    await dispatcher.send(ctx.channel, "🗑 既読データをリセットしました。", priority=PRIORITY_COMMAND)
 
 
 # ── 起動 ──────────────────────────────────────────────────
-if __name__ == "__main__":
+# ── ヘッドレス実行 (cron / サーバーレス) ─────────────────
+# ゲートウェイに接続せず、Discord の Webhook へ1回だけ投稿して終了する。
+EXIT_OK = 0
+EXIT_CONFIG_ERROR = 1      # 設定の不足・誤り
+EXIT_SEND_FAILED = 3       # 投稿に失敗したメッセージがある
+EXIT_UNEXPECTED = 4        # 予期しない例外
+EXIT_NO_DATA = 5           # 投稿する集計データがない（--ranking）
+
+
+class WebhookChannel:
+    """Webhook をチャンネルと同じ send() で扱うためのアダプター（ディスパッチャ・送信箱からそのまま使える）"""
+
+    def __init__(self, webhook: discord.Webhook):
+        self.webhook = webhook
+        self.id = webhook.id
+
+    async def send(self, content=None, *, embed=None, embeds=None, nonce=None, **kwargs):
+        # Webhook は nonce に対応しないため、送信箱からの再送は重複する場合がある
+        if embed is not None:
+            kwargs["embed"] = embed
+        if embeds is not None:
+            kwargs["embeds"] = embeds
+        if content is not None:
+            kwargs["content"] = content
+        return await self.webhook.send(wait=True, **kwargs)
+
+
+async def run_headless(mode: str) -> int:
+    """mode ("once" / "digest" / "ranking") の処理を Webhook 宛てに1回だけ行い、終了コードを返す"""
+    try:
+        webhook = discord.Webhook.from_url(WEBHOOK_URL, session=get_http_session())
+    except ValueError as e:
+        print(f"❌ DISCORD_WEBHOOK_URL が不正です: {e}")
+        await close_http_session()
+        return EXIT_CONFIG_ERROR
+    channel = WebhookChannel(webhook)
+    try:
+        await replay_outbox({channel.id: channel})
+        if mode == "once":
+            # 既定の配信先 (DISCORD_CHANNEL_ID) と同じ既読・フィルターで投稿する
+            route = next((route for route in ROUTES if route.namespace is None), None)
+            if route is None:
+                route = Route(CHANNEL_ID, feeds=[f["name"] for f in POLL_FEEDS])
+            feeds = [f for f in ROUTED_FEEDS if f.get("ranking") or route.wants(f["name"])]
+            await _seed_duplicate_index()
+            count = await _deliver_feeds([(channel, route)], feeds)
+            print(f"📰 新着 {count} 件を投稿しました ({len(feeds)} フィード)")
+        elif mode == "digest":
+            await _seed_duplicate_index()
+            await _post_morning_news([channel])
+        else:
+            if build_ranking_embed("weekly", RANKING_FEED) is None:
+                # ブックマーク数がまだ記録されていなければ、集計対象のフィードをここで1回取得して記録する
+                feeds = [f for f in RSS_FEEDS if f["name"] == RANKING_FEED]
+                async with aclosing(fetch_feeds(get_http_session(), feeds)) as fetched:
+                    async for _ in fetched:
+                        pass
+            if build_ranking_embed("weekly", RANKING_FEED) is None:
+                print("❌ 週刊ランキング: 集計データがありません")
+                return EXIT_NO_DATA
+            await _post_weekly_ranking([channel])
+    except Exception as e:
+        print(f"❌ {mode} の実行に失敗しました: {type(e).__name__}: {e}")
+        import traceback
+        traceback.print_exc()
+        return EXIT_UNEXPECTED
+    finally:
+        await dispatcher.close()
+        await close_http_session()
+        shutdown_parse_executor()
+    print(f"⏱️ 完了: プロセス起動から {perf_counter() - PROCESS_STARTED:.2f} 秒")
+    # 400 で分割して送れた分は失敗に数えない（最終的に送れなかった Embed だけを見る）
+    return EXIT_SEND_FAILED if EMBEDS_FAILED.values.get((str(channel.id),)) else EXIT_OK
+
+
+def main(argv: list[str] | None = None) -> int:
+    """コマンドライン引数を解釈し、常駐 Bot かヘッドレス実行を開始する。終了コードを返す"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="IT ニュース Discord Bot")
+    modes = parser.add_mutually_exclusive_group()
+    modes.add_argument("--once", dest="mode", action="store_const", const="once",
+                       help="新着記事を1回だけ取得して Webhook に投稿し、終了する")
+    modes.add_argument("--digest", dest="mode", action="store_const", const="digest",
+                       help="朝のまとめを Webhook に投稿して終了する")
+    modes.add_argument("--ranking", dest="mode", action="store_const", const="ranking",
+                       help="週刊ランキングを Webhook に投稿して終了する")
+    args = parser.parse_args(argv)
+
+    if args.mode is not None:
+        if not WEBHOOK_URL:
+            print("❌ DISCORD_WEBHOOK_URL が設定されていません。.env ファイルを確認してください。")
+            return EXIT_CONFIG_ERROR
+        return asyncio.run(run_headless(args.mode))
+
     if not TOKEN:
         print("❌ DISCORD_TOKEN が設定されていません。.env ファイルを確認してください。")
-        exit(1)
-    if CHANNEL_ID == 0:
+        return EXIT_CONFIG_ERROR
+    if CHANNEL_ID == 0 and not ROUTES_FILE.exists():
         print("❌ DISCORD_CHANNEL_ID が設定されていません。.env ファイルを確認してください。")
-        exit(1)
+        return EXIT_CONFIG_ERROR
 
+    mark_startup("import")
     bot.run(TOKEN)
+    return EXIT_OK
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())